@@ -1,5 +1,7 @@
 import numpy as np
 
+from instrumentation import timed
+
 def h_measurement(x_state, p1, p2):
     """
     x_state = [x, y]
@@ -45,6 +47,7 @@ def wrap_angle(a):
     return (a + np.pi) % (2*np.pi) - np.pi
 
 
+@timed("filter")
 def ekf_update(x_est, P_est, z_k, p1, p2, R):
     """
     Function that performs EKF update.
@@ -69,3 +72,78 @@ def ekf_update(x_est, P_est, z_k, p1, p2, R):
     x_est_new = x_est + K_k @ y_k
     P_est_new = (np.eye(2) - K_k @ H_k) @ P_est
     return x_est_new, P_est_new
+
+
+def h_measurement_multi(x_states, centers):
+    """
+    Bearings from M array centers to a batch of states.
+    x_states: (..., 2) states [x, y]
+    centers:  (M, 2) array centers
+    Output:   (..., M) with theta_m = atan2(y - p_my, x - p_mx)
+    """
+    x_states = np.asarray(x_states, dtype=float)
+    centers = np.asarray(centers, dtype=float)
+    d = x_states[..., None, :] - centers
+    return np.arctan2(d[..., 1], d[..., 0])
+
+def jacobian_h_multi(x_states, centers):
+    """
+    Jacobian of h_measurement_multi with respect to x = [x, y]:
+    (..., M, 2) with rows [-dy_m / r_m^2, dx_m / r_m^2].
+    """
+    x_states = np.asarray(x_states, dtype=float)
+    centers = np.asarray(centers, dtype=float)
+    d = x_states[..., None, :] - centers
+    # Prevent division by zero
+    rsq = np.maximum(np.sum(d**2, axis=-1), 1e-12)
+    return np.stack([-d[..., 1] / rsq, d[..., 0] / rsq], axis=-1)
+
+@timed("filter")
+def ekf_update_multi(x_est, P_est, z_k, centers, R, mask=None):
+    """
+    Bearings-only EKF update for M arrays and a batch of B states.
+    - x_est: (B, 2) or (2,) states, P_est: (B, 2, 2) or (2, 2) covariances
+    - z_k: (B, M) or (M,) measured angles; NaN marks an array without a DoA
+    - centers: (M, 2) centers of sensor arrays
+    - R: (M, M) measurement noise covariance, (M,) variances or a scalar
+    - mask: optional bool (M,) or (B, M), False to skip an array's bearing
+    Skipped arrays get a zero Jacobian row and innovation and a decoupled
+    unit noise entry, so they contribute nothing to the update.
+    Returns: (x_est_new, P_est_new) with the same shapes as the inputs
+    """
+    x_est = np.asarray(x_est, dtype=float)
+    P_est = np.asarray(P_est, dtype=float)
+    single = x_est.ndim == 1
+    x = np.atleast_2d(x_est)
+    P = P_est[None] if single else P_est
+    centers = np.asarray(centers, dtype=float)
+    M = centers.shape[0]
+    z = np.broadcast_to(np.asarray(z_k, dtype=float), x.shape[:-1] + (M,))
+
+    valid = ~np.isnan(z)
+    if mask is not None:
+        valid = valid & np.asarray(mask, dtype=bool)
+
+    R = np.asarray(R, dtype=float)
+    if R.ndim < 2:
+        R = np.eye(M) * R
+    # Decouple skipped arrays: zero their rows/cols, unit variance on the diagonal
+    both = valid[..., :, None] & valid[..., None, :]
+    R_eff = np.where(both, R, 0.0) + np.eye(M) * ~valid[..., None, :]
+
+    # Wrapped innovations and Jacobians, zeroed for skipped arrays
+    y_k = np.where(valid, wrap_angle(np.where(valid, z, 0.0) - h_measurement_multi(x, centers)), 0.0)
+    H_k = jacobian_h_multi(x, centers) * valid[..., None]
+
+    PHt = P @ np.swapaxes(H_k, -1, -2)                               # (B, 2, M)
+    S_k = H_k @ PHt + R_eff                                          # (B, M, M)
+    # K = P H^T S^-1 via a solve (S is symmetric)
+    K_k = np.swapaxes(np.linalg.solve(S_k, np.swapaxes(PHt, -1, -2)), -1, -2)
+    x_new = x + (K_k @ y_k[..., None])[..., 0]
+    # Joseph-form covariance update
+    IKH = np.eye(2) - K_k @ H_k
+    P_new = (IKH @ P @ np.swapaxes(IKH, -1, -2) +
+             K_k @ R_eff @ np.swapaxes(K_k, -1, -2))
+    if single:
+        return x_new[0], P_new[0]
+    return x_new, P_new
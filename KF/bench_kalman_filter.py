@@ -0,0 +1,42 @@
+"""
+Run from the repository root: python -m KF.bench_kalman_filter
+"""
+import time
+import numpy as np
+
+from KF.kalman_filter import KalmanFilter2D
+
+def time_updates(kf, measurements):
+    """
+    Average wall time (microseconds) of one predict + update step.
+    """
+    start = time.perf_counter()
+    for z in measurements:
+        kf.predict()
+        kf.update(z)
+    return (time.perf_counter() - start) / len(measurements) * 1e6
+
+def main():
+    rng = np.random.default_rng(0)
+    src = np.array([3.0, -4.0])
+    num_warmup = 500
+    num_steps = 20000
+    z_warmup = src + np.sqrt(0.1) * rng.standard_normal((num_warmup, 2))
+    z = src + np.sqrt(0.1) * rng.standard_normal((num_steps, 2))
+
+    results = {}
+    for label, steady_state in [("full recursion", False), ("steady-state gain", True)]:
+        kf = KalmanFilter2D(dt=1.0, q_scale=1e-4, r_scale=0.1, steady_state=steady_state)
+        # Let the gain converge first so the steady-state path is active
+        time_updates(kf, z_warmup)
+        results[label] = (time_updates(kf, z), kf.x_est.copy())
+
+    print(f"{'mode':<20} {'us/step':>10}   final estimate")
+    for label, (us, x) in results.items():
+        print(f"{label:<20} {us:>10.2f}   ({x[0]:.4f}, {x[1]:.4f})")
+    full = results["full recursion"][0]
+    fast = results["steady-state gain"][0]
+    print(f"speed-up: {full / fast:.1f}x")
+
+if __name__ == "__main__":
+    main()
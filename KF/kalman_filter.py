@@ -1,12 +1,44 @@
 import numpy as np
+import scipy.linalg as LA
+
+from instrumentation import timed
+
+def _model_matrix(name):
+    """
+    Property holding a read-only copy of a model matrix; assigning a new one
+    marks the steady-state solution as stale.
+    """
+    attr = "_" + name
+    def fget(self):
+        return getattr(self, attr)
+    def fset(self, value):
+        value = np.array(value, dtype=float)
+        value.setflags(write=False)
+        setattr(self, attr, value)
+        self._ss_solved = False
+    return property(fget, fset)
 
 class KalmanFilter2D:
     """
     Simple linear Kalman Filter for 2D position tracking (x, y).
     State: x_k = [x, y]
     Measurement: z_k = [x, y] + measurement noise
+
+    With steady_state=True the discrete algebraic Riccati equation is solved
+    once for the current F, H, Q, R. Once the running gain has converged to
+    the steady-state gain (relative tolerance ss_tol), predict/update switch to a
+    constant-gain fast path. Assigning a new F, H, Q or R (kf.Q = ...) drops
+    back to the full recursion until the new gain converges; the matrices
+    are stored read-only, so in-place edits raise instead of going unnoticed.
+    P_est stays a writable array of its own in both modes.
     """
-    def __init__(self, dt=1.0, q_scale=1e-4, r_scale=0.1):
+    F = _model_matrix("F")
+    H = _model_matrix("H")
+    Q = _model_matrix("Q")
+    R = _model_matrix("R")
+
+    def __init__(self, dt=1.0, q_scale=1e-4, r_scale=0.1,
+                 steady_state=False, ss_tol=1e-3):
         # State transition matrix (assuming x and y are constant)
         self.F = np.eye(2)
         self.dt = dt
@@ -23,23 +55,137 @@ class KalmanFilter2D:
         
         # R: measurement noise covariance (measurement error)
         self.R = np.eye(2) * r_scale
+        
+        # Steady-state (constant gain) mode
+        self.steady_state = steady_state
+        self.ss_tol = ss_tol
+        self._ss_solved = False
+        self._ss_active = False
+        self._K_inf = None
+        self._P_prior_inf = None
+        self._P_post_inf = None
 
+    def _check_steady_state(self):
+        """
+        (Re)solve the Riccati equation when the model changed.
+        Returns True if the constant-gain path may be used right now.
+        """
+        if not self._ss_solved:
+            self._ss_solved = True
+            self._ss_active = False
+            try:
+                # Prior steady-state covariance P = F P F^T - ... + Q
+                P = LA.solve_discrete_are(self.F.T, self.H.T, self.Q, self.R)
+            except (ValueError, np.linalg.LinAlgError):
+                self._K_inf = None
+                return False
+            S = self.H @ P @ self.H.T + self.R
+            K = LA.solve(S.T, self.H @ P.T).T
+            self._K_inf = K
+            self._P_prior_inf = P
+            self._P_post_inf = (np.eye(2) - K @ self.H) @ P
+            # Templates copied into P_est by every constant-gain step
+            self._P_prior_inf.setflags(write=False)
+            self._P_post_inf.setflags(write=False)
+        return self._ss_active
+
+    @timed("filter")
     def predict(self):
+        if self.steady_state and self._check_steady_state():
+            self.x_est = self.F @ self.x_est
+            self.P_est = self._P_prior_inf.copy()
+            return
         # Prior state estimate (x_{k|k-1})
         self.x_est = self.F @ self.x_est
         # Prior covariance estimate (P_{k|k-1})
         self.P_est = self.F @ self.P_est @ self.F.T + self.Q
 
+    @timed("filter")
     def update(self, z_meas):
+        if self.steady_state and self._check_steady_state():
+            # Constant-gain update
+            self.x_est = self.x_est + self._K_inf @ (z_meas - self.H @ self.x_est)
+            self.P_est = self._P_post_inf.copy()
+            return
+        self._update_full(z_meas)
+
+    def _update_full(self, z_meas):
         # Innovation
         y_k = z_meas - self.H @ self.x_est
         # Innovation covariance
         S_k = self.H @ self.P_est @ self.H.T + self.R
-        # Kalman gain
-        K_k = self.P_est @ self.H.T @ np.linalg.inv(S_k)
+        # Kalman gain K = P H^T S^-1, via a solve: S^T K^T = H P^T
+        K_k = np.linalg.solve(S_k.T, self.H @ self.P_est.T).T
         # State update
         self.x_est = self.x_est + K_k @ y_k
         
         # Covariance update
         I = np.eye(2)
-        self.P_est = (I - K_k @ self.H) @ self.P_est
\ No newline at end of file
+        self.P_est = (I - K_k @ self.H) @ self.P_est
+        
+        # Switch to the constant-gain path once the gain has converged
+        if (self.steady_state and self._K_inf is not None and
+                np.max(np.abs(K_k - self._K_inf)) <
+                self.ss_tol * np.max(np.abs(self._K_inf))):
+            self._ss_active = True
+
+class KalmanFilterBank2D:
+    """
+    Bank of K independent 2D Kalman filters with the same model as
+    KalmanFilter2D, stored contiguously so that predict/update run as batched
+    array operations instead of K Python objects.
+    States: x_est (K, 2), covariances: P_est (K, 2, 2)
+    """
+    def __init__(self, num_tracks, dt=1.0, q_scale=1e-4, r_scale=0.1):
+        self.F = np.eye(2)
+        self.dt = dt
+        self.H = np.eye(2)
+        
+        self.x_est = np.zeros((num_tracks, 2))
+        self.P_est = np.tile(np.eye(2) * 100.0, (num_tracks, 1, 1))
+        
+        self.Q = np.eye(2) * q_scale
+        self.R = np.eye(2) * r_scale
+
+    @property
+    def num_tracks(self):
+        return self.x_est.shape[0]
+
+    @timed("filter")
+    def predict(self):
+        # Prior states and covariances of all tracks
+        self.x_est = self.x_est @ self.F.T
+        self.P_est = self.F @ self.P_est @ self.F.T + self.Q
+
+    @timed("filter")
+    def update(self, z_meas, mask=None):
+        """
+        z_meas: (K, 2) measurements, one row per track
+        mask:   optional bool (K,), False for tracks without a measurement
+                this frame (rows containing NaN are skipped as well)
+        """
+        z_meas = np.asarray(z_meas, dtype=float)
+        active = ~np.isnan(z_meas).any(axis=1)
+        if mask is not None:
+            active &= np.asarray(mask, dtype=bool)
+        if not active.any():
+            return
+        idx = np.flatnonzero(active)
+        x = self.x_est[idx]
+        P = self.P_est[idx]
+        H = self.H
+        
+        # Innovation and its covariance
+        y_k = z_meas[idx] - x @ H.T
+        PHt = P @ H.T
+        S_k = H @ PHt + self.R
+        # Kalman gain K = P H^T S^-1, via a solve: S^T K^T = H P^T
+        K_k = np.swapaxes(np.linalg.solve(np.swapaxes(S_k, -1, -2),
+                                          np.swapaxes(PHt, -1, -2)), -1, -2)
+        # State update
+        self.x_est[idx] = x + (K_k @ y_k[..., None])[..., 0]
+        
+        # Joseph-form covariance update (stays symmetric positive definite)
+        IKH = np.eye(2) - K_k @ H
+        self.P_est[idx] = (IKH @ P @ np.swapaxes(IKH, -1, -2) +
+                           K_k @ self.R @ np.swapaxes(K_k, -1, -2))
@@ -1,5 +1,8 @@
 import numpy as np
 
+from instrumentation import timed
+
+@timed("triangulation")
 def estimate_position_from_angles(positions, angles):
     """
     positions: shape (M,2) -> Centers of the arrays
@@ -44,4 +47,62 @@ def estimate_position_from_angles(positions, angles):
     ATA = A.T @ A
     ATb = A.T @ b
     X = np.linalg.pinv(ATA) @ ATb  # pseudo-inverse
-    return X[0], X[1]
\ No newline at end of file
+    return X[0], X[1]
+
+@timed("triangulation")
+def estimate_positions_batch(positions, angles, mask=None, noise_var=1.0):
+    """
+    Batched version of estimate_position_from_angles for whole sessions.
+
+    positions: shape (M,2)     -> Centers of the arrays
+    angles:    shape (..., M)  -> e.g. (T, M) frames or (T, K, M) frames x tracks
+    mask:      optional bool (..., M), False where an array has no bearing;
+               NaN angles are treated as missing as well
+    noise_var: variance used to scale the covariance (1.0 gives pure GDOP)
+
+    Same normal equations as estimate_position_from_angles, but the 2x2
+    system (A^T A) X = A^T b is accumulated and solved in closed form for
+    every estimate at once:
+        A^T A = [[a, b], [b, d]],  X = [[d, -b], [-b, a]] A^T b / (a d - b^2)
+
+    Returns:
+      X:         (..., 2) estimated positions (NaN if fewer than two usable,
+                 non-parallel bearings)
+      residuals: (...,)   sum of squared distances of X to its bearing lines
+      cov:       (..., 2, 2) noise_var * inv(A^T A), a GDOP-style covariance
+    """
+    positions = np.asarray(positions, dtype=float)
+    angles = np.asarray(angles, dtype=float)
+    valid = ~np.isnan(angles)
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)
+
+    th = np.where(valid, angles, 0.0)
+    # Normal vectors n_i = [-sin, cos], zeroed for missing bearings
+    nx = np.where(valid, -np.sin(th), 0.0)
+    ny = np.where(valid, np.cos(th), 0.0)
+    c = nx * positions[:, 0] + ny * positions[:, 1]
+
+    a = np.sum(nx * nx, axis=-1)
+    b = np.sum(nx * ny, axis=-1)
+    d = np.sum(ny * ny, axis=-1)
+    e = np.sum(nx * c, axis=-1)
+    f = np.sum(ny * c, axis=-1)
+
+    det = a * d - b * b
+    singular = det <= 1e-12 * np.maximum((a + d)**2, 1e-300)
+    inv_det = 1.0 / np.where(singular, np.nan, det)
+
+    x = (d * e - b * f) * inv_det
+    y = (a * f - b * e) * inv_det
+    X = np.stack([x, y], axis=-1)
+
+    residuals = np.sum((nx * x[..., None] + ny * y[..., None] - c)**2 * valid, axis=-1)
+
+    cov = np.empty(det.shape + (2, 2))
+    cov[..., 0, 0] = d
+    cov[..., 0, 1] = -b
+    cov[..., 1, 0] = -b
+    cov[..., 1, 1] = a
+    cov *= (noise_var * inv_det)[..., None, None]
+    return X, residuals, cov
@@ -1,6 +1,81 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
 import numpy as np
 import scipy.linalg as LA
 
+from instrumentation import timed
+
+# Steering matrices are cached per (array geometry, scan grid) so that repeated
+# MUSIC scans over the same grid only pay for building the manifold once.
+STEERING_CACHE_SIZE = 32
+_steering_cache = OrderedDict()
+_steering_cache_lock = threading.Lock()
+
+# Result of subspace_decomposition: the eigenpairs actually computed, with
+# eigvals in descending order and vectors ordered the same way. is_noise tells
+# whether vectors span the noise subspace (True) or the signal subspace (False).
+Subspace = namedtuple('Subspace', ['eigvals', 'vectors', 'is_noise'])
+
+# Result of top_peaks: (..., L) arrays ordered by decreasing prominence,
+# padded with index -1 and NaN angle/height/prominence where fewer peaks exist.
+Peaks = namedtuple('Peaks', ['indices', 'angles', 'heights', 'prominences'])
+
+# Wavenumber of the synthetic narrowband scenarios: element positions are
+# expressed in wavelengths, so k = 2*pi. Real recordings use
+# wavenumber(freq) = 2*pi*f / c instead.
+DEFAULT_WAVENUMBER = 2*np.pi
+SPEED_OF_SOUND = 343.0      # m/s, air at ~20 °C
+
+# Working precision of the array, MUSIC and triangulation stages: "double"
+# (float64/complex128) or "single" (float32/complex64), set with
+# set_precision() or SSM_PRECISION=single. The KF/EKF filters always run in
+# float64.
+PRECISIONS = {"double": (np.float64, np.complex128),
+              "single": (np.float32, np.complex64)}
+_precision = os.environ.get("SSM_PRECISION", "double")
+if _precision not in PRECISIONS:
+    raise ValueError(f"SSM_PRECISION must be one of {sorted(PRECISIONS)}")
+
+def set_precision(precision):
+    """
+    Select "double" or "single" precision for all subsequent computations.
+    Cached steering matrices are kept per precision.
+    """
+    global _precision
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown precision {precision!r}, expected one of {sorted(PRECISIONS)}")
+    _precision = precision
+
+def get_precision():
+    return _precision
+
+@contextmanager
+def use_precision(precision):
+    """
+    Temporarily switch the working precision (see set_precision).
+    """
+    previous = _precision
+    set_precision(precision)
+    try:
+        yield
+    finally:
+        set_precision(previous)
+
+def real_dtype():
+    return PRECISIONS[_precision][0]
+
+def complex_dtype():
+    return PRECISIONS[_precision][1]
+
+def wavenumber(freq, c=SPEED_OF_SOUND):
+    """
+    Acoustic wavenumber k = 2*pi*f / c [rad/m] for frequency freq [Hz].
+    """
+    return 2*np.pi * np.asarray(freq, dtype=float) / c
+
 def generate_circular_array(center, N, radius):
     """
     Generate a 2D circular array (N elements) around center with given radius.
@@ -14,21 +89,414 @@ def generate_circular_array(center, N, radius):
         arr.append([x, y])
     return np.array(arr)
 
-def array_response_vector_circular(array_2D, theta):
+def array_response_vector_circular(array_2D, theta, wavenumber=DEFAULT_WAVENUMBER):
     """
     Compute the array response (manifold) vector for a circular array in 2D.
     array_2D.shape[0] = number of elements in the array.
+    wavenumber: k in exp(j k (x cos θ + y sin θ)); 2*pi by default, use
+                wavenumber(freq) for positions in meters at frequency freq.
     """
+    rdt = real_dtype()
+    array_2D = np.asarray(array_2D, dtype=rdt)
+    theta = np.asarray(theta, dtype=rdt)
     N = array_2D.shape[0]
     x = array_2D[:,0]
     y = array_2D[:,1]
     kx = np.cos(theta)
     ky = np.sin(theta)
-    # Here, 2*pi is used as the wavenumber factor.
-    v = np.exp(1j * 2*np.pi * (x*kx + y*ky))
-    return v / np.sqrt(N)
+    v = np.exp(1j * rdt(wavenumber) * (x*kx + y*ky))
+    return v / rdt(np.sqrt(N))
 
-def measure_covmat(array_2D, Thetas, Alphas, snr, num_snapshot=100):
+def _steering_vectors(array_2D, thetas, wavenumber=DEFAULT_WAVENUMBER):
+    """
+    Uncached, broadcasting version of array_response_vector_circular:
+    array_2D (..., N, 2) and thetas (..., G) give a (..., N, G) manifold.
+    A (K,) array of wavenumbers adds a leading axis: (K, ..., N, G).
+    """
+    rdt = real_dtype()
+    array_2D = np.asarray(array_2D, dtype=rdt)
+    thetas = np.asarray(thetas, dtype=rdt)
+    N = array_2D.shape[-2]
+    phase = (array_2D[..., :, 0, None] * np.cos(thetas)[..., None, :] +
+             array_2D[..., :, 1, None] * np.sin(thetas)[..., None, :])
+    k = np.asarray(wavenumber, dtype=rdt)
+    k = k.reshape(k.shape + (1,) * phase.ndim)
+    return np.exp(1j * k * phase) / rdt(np.sqrt(N))
+
+def steering_matrix_circular(array_2D, Angles, wavenumber=DEFAULT_WAVENUMBER):
+    """
+    Compute the N x G steering matrix of a 2D array over a scan grid.
+    Column g equals array_response_vector_circular(array_2D, Angles[g], wavenumber).
+    A stack of M arrays (M x N x 2) gives an M x N x G steering tensor, and
+    a (K,) array of wavenumbers (one per frequency bin) a K x N x G one.
+
+    The matrix is kept in a bounded LRU cache keyed by the array geometry,
+    the grid, the wavenumber and the precision, so it is built once and
+    reused across frames. The returned array is read-only since it is shared
+    between callers.
+    """
+    array_2D = np.ascontiguousarray(array_2D, dtype=float)
+    Angles = np.ascontiguousarray(Angles, dtype=float)
+    wavenumber = np.array(wavenumber, dtype=float)
+    key = (array_2D.shape, array_2D.tobytes(), Angles.shape, Angles.tobytes(),
+           wavenumber.shape, wavenumber.tobytes(), _precision)
+
+    with _steering_cache_lock:
+        A = _steering_cache.get(key)
+        if A is not None:
+            _steering_cache.move_to_end(key)
+            return A
+
+    A = _steering_vectors(array_2D, Angles.ravel(), wavenumber)
+    A.setflags(write=False)
+
+    with _steering_cache_lock:
+        _steering_cache[key] = A
+        while len(_steering_cache) > STEERING_CACHE_SIZE:
+            _steering_cache.popitem(last=False)
+    return A
+
+def clear_steering_cache():
+    """
+    Drop all cached steering matrices.
+    """
+    with _steering_cache_lock:
+        _steering_cache.clear()
+
+def _noise_projection_norms(Qn, A):
+    """
+    || P_n a || for every column a of A (..., N, G), where P_n projects onto
+    the noise subspace. Qn is either an N x (N-L) noise basis or a Subspace;
+    for a signal-subspace Subspace, ||a||^2 - ||Qs^H a||^2 is used so only the
+    L signal vectors are touched.
+    """
+    if isinstance(Qn, Subspace):
+        if not Qn.is_noise:
+            QsH = np.swapaxes(Qn.vectors, -1, -2).conj()
+            sq = (np.sum(np.abs(A)**2, axis=-2) -
+                  np.sum(np.abs(QsH @ A)**2, axis=-2))
+            return np.sqrt(np.maximum(sq, np.finfo(sq.dtype).tiny))
+        Qn = Qn.vectors
+    return LA.norm(Qn.conj().T @ A, axis=-2)
+
+@timed("spectrum")
+def music_spectrum(Qn, array_2D, Angles, wavenumber=DEFAULT_WAVENUMBER):
+    """
+    Evaluate the MUSIC pseudospectrum 1 / || Qn^H a(θ) || over all Angles
+    with a single matrix product against the cached steering matrix.
+
+    Parameters:
+      Qn: N x (N-L) noise subspace, or a Subspace from subspace_decomposition
+      array_2D: (N x 2) sensor array
+      Angles: 1D array of angles (radians) to scan over
+      wavenumber: steering wavenumber (see array_response_vector_circular)
+    """
+    A = steering_matrix_circular(array_2D, Angles, wavenumber)
+    return 1.0 / _noise_projection_norms(Qn, A)
+
+def wrap_to_pi(a):
+    """
+    Wrap angle(s) a to the interval [-pi, pi).
+    """
+    return (a + np.pi) % (2*np.pi) - np.pi
+
+def _grid_step(Angles):
+    """
+    Typical spacing of a scan grid.
+    """
+    return float(np.median(np.abs(np.diff(Angles))))
+
+def _circle_samples(Angles):
+    """
+    Number of distinct samples of a grid covering the full circle (a
+    duplicated endpoint, as in np.linspace(-np.pi, np.pi, G), excluded), or
+    None for a partial sector.
+    """
+    G = len(Angles)
+    if G < 2:
+        return None
+    step = _grid_step(Angles)
+    span = abs(Angles[-1] - Angles[0])
+    if span + 1.5*step < 2*np.pi:
+        return None
+    return G - 1 if abs(span - 2*np.pi) < 0.5*step else G
+
+def _local_max_mask(pspectrum, wrap):
+    """
+    Boolean mask of local maxima along the last axis of pspectrum (..., G).
+    When the grid covers the full circle (wrap = _circle_samples(Angles))
+    the first and last samples are treated as neighbours, and a duplicated
+    endpoint (as in np.linspace(-np.pi, np.pi, G)) is never reported.
+    """
+    p = np.asarray(pspectrum)
+    G = wrap
+    if G is None:
+        # Partial sector: endpoints have a single neighbour.
+        pad = np.full(p.shape[:-1] + (1,), -np.inf, dtype=p.dtype)
+        pp = np.concatenate((pad, p, pad), axis=-1)
+        return (p > pp[..., :-2]) & (p >= pp[..., 2:])
+
+    mask = np.zeros(p.shape, dtype=bool)
+    q = p[..., :G]
+    mask[..., :G] = (q > np.roll(q, 1, axis=-1)) & (q >= np.roll(q, -1, axis=-1))
+    return mask
+
+_PROMINENCE_CHUNK = 1 << 20     # peak x sample elements per block
+
+def _peak_prominences(values, mask, wrap):
+    """
+    Prominences (B, G) of the peaks in mask of a (B, G) stack, -inf elsewhere
+    (same definition as scipy.signal.peak_prominences), in values' dtype.
+
+    Each row is padded with +inf on both sides; on a full circle (wrap
+    distinct samples) it is first rotated to start at its maximum and
+    closed with it again, which turns the circular base search into a
+    linear one. For every peak the nearest strictly higher sample on each
+    side (searched for all peaks together, in blocks of at most
+    _PROMINENCE_CHUNK elements) bounds the running minimum of that side,
+    taken with np.minimum.reduceat; the prominence is the height above the
+    higher of the two minima. Peaks at the row maximum get their height
+    above the row minimum.
+    """
+    B, G = values.shape
+    prom = np.full((B, G), -np.inf, dtype=values.dtype)
+    rows, cols = np.nonzero(mask)
+    if len(rows) == 0:
+        return prom
+    if wrap is None:
+        seg, pos = values, cols
+    else:
+        v = values[:, :wrap]
+        shift = np.argmax(v, axis=-1)
+        seg = np.take_along_axis(v, (shift[:, None] + np.arange(wrap + 1)) % wrap, axis=-1)
+        pos = (cols - shift[rows]) % wrap
+    W = seg.shape[1] + 2
+    x = np.full((B, W), np.inf, dtype=values.dtype)
+    x[:, 1:-1] = seg
+    pos = pos + 1
+    idx = np.arange(W)
+
+    flat = x.ravel()
+    h = x[rows, pos]
+    left = np.empty_like(pos)
+    right = np.empty_like(pos)
+    step = max(1, _PROMINENCE_CHUNK // W)
+    for s in range(0, len(rows), step):
+        p = pos[s:s + step, None]
+        higher = x[rows[s:s + step]] > h[s:s + step, None]     # (P, W)
+        # nearest higher sample left / right of the peak (the +inf pads exist)
+        left[s:s + step] = W - 1 - np.argmax((higher & (idx < p))[:, ::-1], axis=-1)
+        right[s:s + step] = np.argmax(higher & (idx > p), axis=-1)
+    # running minima over flat[left + 1 : pos + 1] and flat[pos : right]
+    start = rows * W
+    bounds = np.stack([start + left + 1, start + pos + 1, start + pos, start + right], axis=-1)
+    mins = np.minimum.reduceat(flat, bounds.ravel())[0::2].reshape(-1, 2)
+    prom[rows, cols] = h - mins.max(axis=-1)
+    if wrap is not None:
+        top = values[rows, cols] == v[rows, shift[rows]]
+        prom[rows[top], cols[top]] = (values[rows[top], cols[top]] -
+                                      v.min(axis=-1)[rows[top]])
+    return prom
+
+@timed("find_peaks")
+def top_peaks(spectra, Angles, L, log=False, min_prominence=0.0):
+    """
+    The L most prominent peaks of each row of a (B, G) stack of spectra
+    (or of a single (G,) spectrum).
+
+    Peaks are the samples higher than their left neighbour and at least as
+    high as their right one (_local_max_mask). On a grid covering the full
+    circle the first and last samples are neighbours, so a peak straddling
+    ±pi is found, and a duplicated endpoint (as in np.linspace(-np.pi,
+    np.pi, G)) is never reported. Spectra of fewer than three samples have
+    their maximum as the only peak. A peak's prominence is its height
+    above the higher of the two lowest points separating it from a higher
+    sample on either side (wrapping around the circle). With log=True the
+    prominences are measured on 10 log10(spectra), i.e. in dB, which ranks
+    weak but sharp MUSIC peaks above ripples on the flank of a strong one.
+    The top L are selected with argpartition, so the cost stays linear in G.
+
+    Parameters:
+      spectra: (B, G) or (G,) spectra sampled on Angles
+      Angles: scan grid (radians)
+      L: number of peaks per row
+      log: measure prominences in dB
+      min_prominence: peaks below this prominence are dropped
+
+    Returns Peaks(indices, angles, heights, prominences), each of shape
+    (B, L) or (L,), ordered by decreasing prominence and padded with -1 /
+    NaN where a row has fewer than L peaks. The prominences are computed
+    in the spectra's floating dtype (float32 spectra are not upcast).
+    """
+    Angles = np.asarray(Angles)
+    p = np.asarray(spectra)
+    single = p.ndim == 1
+    p = np.atleast_2d(p)
+    B, G = p.shape
+    values = p.astype(np.result_type(p.dtype, np.float32), copy=False)
+    if log:
+        values = 10*np.log10(np.maximum(values, np.finfo(values.dtype).tiny))
+    wrap = _circle_samples(Angles)
+    if G < 3:
+        mask = np.arange(G) == np.argmax(p, axis=-1)[:, None]
+    else:
+        mask = _local_max_mask(p, wrap)
+    prom = _peak_prominences(values, mask, wrap)
+    prom[prom < min_prominence] = -np.inf
+
+    rows = np.arange(B)[:, None]
+    K = min(L, G)
+    if K < G:
+        cand = np.argpartition(-prom, K - 1, axis=-1)[:, :K]
+    else:
+        cand = np.broadcast_to(np.arange(G), (B, G))
+    idx = cand[rows, np.argsort(-prom[rows, cand], axis=-1, kind="stable")]
+    if K < L:
+        idx = np.concatenate((idx, np.zeros((B, L - K), dtype=idx.dtype)), axis=-1)
+    top = prom[rows, idx]
+    valid = np.isfinite(top)
+    valid[:, K:] = False
+    peaks = Peaks(np.where(valid, idx, -1),
+                  np.where(valid, Angles[idx], np.nan).astype(Angles.dtype, copy=False),
+                  np.where(valid, p[rows, idx], np.nan),
+                  np.where(valid, top, np.nan))
+    return Peaks(*(a[0] for a in peaks)) if single else peaks
+
+@timed("spectrum")
+def refine_music_peaks(Qn, array_2D, doa_coarse, step, num_points=9,
+                       tol=np.deg2rad(0.01), max_iter=20, wavenumber=DEFAULT_WAVENUMBER):
+    """
+    Refine coarse DoA candidates of the MUSIC pseudospectrum.
+
+    Each candidate is re-scanned on a small local grid of num_points angles
+    spanning ±step around it; the local grid is shrunk around the new maximum
+    until its spacing falls below tol, and the result is finished with
+    parabolic interpolation over the last three samples. All candidates are
+    refined together, and angles wrap correctly at ±pi.
+
+    Parameters:
+      Qn: N x (N-L) noise subspace, or a Subspace
+      array_2D: (N x 2) sensor array
+      doa_coarse: coarse peak angles (radians)
+      step: spacing of the coarse grid (radians)
+    Returns the refined angles, wrapped to [-pi, pi).
+    """
+    def spectrum(grid):
+        A = _steering_vectors(array_2D, grid, wavenumber)          # (P, N, K)
+        return 1.0 / _noise_projection_norms(Qn, A)                # (P, K)
+    return _refine_peaks(spectrum, doa_coarse, step, num_points, tol, max_iter)
+
+def _refine_peaks(spectrum, doa_coarse, step, num_points=9, tol=np.deg2rad(0.01),
+                  max_iter=20):
+    """
+    Grid-shrinking plus parabolic refinement behind refine_music_peaks.
+    spectrum(grid) evaluates a pseudospectrum on a (P x K) grid of angles.
+    """
+    centers = np.atleast_1d(np.asarray(doa_coarse, dtype=real_dtype()))
+    if centers.size == 0:
+        return centers
+    offsets = np.linspace(-1.0, 1.0, num_points, dtype=centers.dtype)
+    half_width = centers.dtype.type(step)
+    for _ in range(max_iter):
+        grid = centers[:, None] + half_width * offsets
+        ps = spectrum(grid)
+        best = np.argmax(ps, axis=1)
+        centers = grid[np.arange(len(centers)), best]
+        half_width = 2.0 * half_width / (num_points - 1)
+        if half_width < tol:
+            break
+
+    # Parabolic interpolation through (center - h, center, center + h)
+    grid = centers[:, None] + half_width * np.array([-1.0, 0.0, 1.0], dtype=centers.dtype)
+    y = spectrum(grid)
+    denom = y[:, 0] - 2*y[:, 1] + y[:, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(denom < 0, 0.5 * (y[:, 0] - y[:, 2]) / denom, 0.0)
+    delta = np.clip(delta, -1.0, 1.0)
+    return wrap_to_pi(centers + delta * half_width)
+
+def default_rng(rng=None):
+    """
+    Return rng, or a Generator seeded from the legacy global stream when rng is
+    None so that np.random.seed(...) in the demo scripts keeps runs reproducible.
+    """
+    if rng is None:
+        return np.random.default_rng(np.random.randint(2**32, dtype=np.uint64))
+    return rng
+
+def simulate_snapshots(array_2D, Thetas, Alphas, snr, num_snapshot=100,
+                       num_trials=1, rng=None, wavenumber=DEFAULT_WAVENUMBER):
+    """
+    Simulate array snapshots for a batch of independent trials.
+
+    Parameters:
+      array_2D: N x 2 element positions, or M x N x 2 for M arrays
+      Thetas: angles of incoming signals, shape (L,) or (M, L) per array
+      Alphas: complex amplitudes of the L sources (shared by all arrays)
+      snr: signal-to-noise ratio (linear scale)
+      num_snapshot: number of snapshots T per trial
+      num_trials: number of independent trials B
+      rng: numpy.random.Generator used for all draws
+      wavenumber: steering wavenumber (see array_response_vector_circular)
+
+    Returns H with shape (B, N, T), or (B, M, N, T) for a stack of arrays.
+    Each snapshot carries an independent uniform random phase per source and
+    circular Gaussian noise, exactly as in measure_covmat.
+    """
+    rng = default_rng(rng)
+    rdt, cdt = real_dtype(), complex_dtype()
+    array_2D = np.asarray(array_2D, dtype=rdt)
+    single_array = array_2D.ndim == 2
+    arrays = array_2D[None] if single_array else array_2D          # (M, N, 2)
+    M, N = arrays.shape[:2]
+    Thetas = np.atleast_1d(np.asarray(Thetas, dtype=rdt))
+    Thetas = np.broadcast_to(Thetas, (M, Thetas.shape[-1]))         # (M, L)
+    Alphas = np.atleast_1d(np.asarray(Alphas, dtype=cdt))
+    L = Thetas.shape[1]
+
+    # Steering vectors of every source at every array: (M, N, L)
+    A = _steering_vectors(arrays, Thetas, wavenumber)
+
+    # Source signals with random phase per (trial, array, source, snapshot)
+    pha = np.exp(1j * 2*np.pi * rng.random((num_trials, M, L, num_snapshot), dtype=rdt))
+    S = Alphas[:, None] * pha
+    H = A @ S
+    # Add Gaussian noise
+    noise_shape = (num_trials, M, N, num_snapshot)
+    H += rdt(np.sqrt(0.5/snr)) * (rng.standard_normal(noise_shape, dtype=rdt) +
+                                  1j*rng.standard_normal(noise_shape, dtype=rdt))
+
+    return H[:, 0] if single_array else H
+
+@timed("covariance")
+def simulate_covmats(array_2D, Thetas, Alphas, snr, num_snapshot=100,
+                     num_trials=1, rng=None, chunk_size=256, wavenumber=DEFAULT_WAVENUMBER):
+    """
+    Monte Carlo covariance simulator: returns a stack of num_trials covariance
+    matrices H @ H^H with shape (B, N, N), or (B, M, N, N) for M arrays.
+    Arguments are the same as simulate_snapshots; trials are generated in
+    chunks of chunk_size so memory stays bounded for large B.
+    """
+    rng = default_rng(rng)
+    chunks = []
+    for start in range(0, num_trials, chunk_size):
+        B = min(chunk_size, num_trials - start)
+        H = simulate_snapshots(array_2D, Thetas, Alphas, snr, num_snapshot, B, rng,
+                               wavenumber)
+        chunks.append(H @ np.swapaxes(H, -1, -2).conj())
+    return np.concatenate(chunks, axis=0)
+
+@timed("covariance")
+def snapshot_covariance(H):
+    """
+    Covariance H @ H^H of (..., N, T) snapshot blocks, scaled like
+    simulate_covmats. Works directly on read-only views, e.g. blocks of a
+    shm_ring.SnapshotRing, without copying them.
+    """
+    H = np.asarray(H, dtype=complex_dtype())
+    return H @ np.swapaxes(H, -1, -2).conj()
+
+def measure_covmat(array_2D, Thetas, Alphas, snr, num_snapshot=100, rng=None):
     """
     Simulate array measurements and compute the covariance matrix.
     
@@ -38,21 +506,34 @@ def measure_covmat(array_2D, Thetas, Alphas, snr, num_snapshot=100):
       Alphas: random complex amplitudes
       snr: signal-to-noise ratio (linear scale)
       num_snapshot: number of snapshots for covariance estimation
+      rng: optional numpy.random.Generator
     """
-    N = array_2D.shape[0]
-    L = len(Thetas)
-    H = np.zeros((N, num_snapshot), dtype=complex)
-    for it in range(num_snapshot):
-        htmp = np.zeros(N, dtype=complex)
-        for i in range(L):
-            # random phase
-            pha = np.exp(1j * 2*np.pi * np.random.rand())
-            htmp += pha * Alphas[i] * array_response_vector_circular(array_2D, Thetas[i])
-        # add Gaussian noise
-        htmp += np.sqrt(0.5/snr)*(np.random.randn(N) + 1j*np.random.randn(N))
-        H[:, it] = htmp
-    
-    return H @ H.conj().T
+    return simulate_covmats(array_2D, Thetas, Alphas, snr, num_snapshot,
+                            num_trials=1, rng=rng)[0]
+
+@timed("eigendecomposition")
+def subspace_decomposition(CovMat, L):
+    """
+    Partial Hermitian eigendecomposition of a covariance matrix for MUSIC.
+
+    Only the smaller of the two subspaces is computed: the L signal
+    eigenpairs when L <= N - L, otherwise the N - L noise eigenpairs.
+    Returns a Subspace(eigvals, vectors, is_noise) with the eigenvalues
+    explicitly sorted in descending order, so callers can reuse them
+    (e.g. for noise-power or source-number estimates).
+    """
+    CovMat = np.asarray(CovMat, dtype=complex_dtype())
+    N = CovMat.shape[0]
+    if not 0 <= L < N:
+        raise ValueError(f"number of sources L={L} must satisfy 0 <= L < N={N}")
+    if 0 < L <= N - L:
+        w, V = LA.eigh(CovMat, subset_by_index=[N - L, N - 1])
+        is_noise = False
+    else:
+        w, V = LA.eigh(CovMat, subset_by_index=[0, N - L - 1])
+        is_noise = True
+    # eigh returns ascending eigenvalues; flip to descending
+    return Subspace(w[::-1], V[:, ::-1], is_noise)
 
 def music(CovMat, L, N, array_2D, Angles):
     """
@@ -63,29 +544,27 @@ def music(CovMat, L, N, array_2D, Angles):
     Angles: 1D array of angles (radians) to scan over
     Returns the MUSIC pseudo-spectrum.
     """
-    # Eigen decomposition of CovMat
-    _, V = LA.eig(CovMat)
-    # Noise subspace (columns for the smallest eigenvalues)
-    Qn = V[:, L:N]
+    Qn = subspace_decomposition(CovMat, L)
 
-    pspectrum = np.zeros_like(Angles)
-    for i, angle in enumerate(Angles):
-        av = array_response_vector_circular(array_2D, angle)
-        # 1 / || Qn^H * a(θ) ||
-        pspectrum[i] = 1.0 / LA.norm(Qn.conj().T @ av)
-    return pspectrum
+    # 1 / || Qn^H * a(θ) || for every angle at once
+    return music_spectrum(Qn, array_2D, Angles)
 
-def get_music_peak(CovMat, array_2D, Angles):
+def get_music_peak(CovMat, array_2D, Angles, refine=False):
     """
     For a single source, find the angle where the MUSIC spectrum is maximized.
     Returns (doa_est, pspectrum, peak_index).
+
+    With refine=True, Angles is treated as a coarse grid and the best grid
+    point is refined off-grid with refine_music_peaks.
     """
-    N = array_2D.shape[0]
-    pspectrum = music(CovMat, L=1, N=N, array_2D=array_2D, Angles=Angles)
+    Qn = subspace_decomposition(CovMat, 1)
+    pspectrum = music_spectrum(Qn, array_2D, Angles)
     # Convert to dB-like scale for easier peak detection
     psindB = np.log10(10 * pspectrum / pspectrum.min())
     peak_idx = np.argmax(psindB)
     doa_est = Angles[peak_idx]
+    if refine:
+        doa_est = refine_music_peaks(Qn, array_2D, doa_est, _grid_step(Angles))[0]
     return doa_est, pspectrum, peak_idx
 
 def true_angle(src, center):
@@ -94,16 +573,19 @@ def true_angle(src, center):
     """
     return np.arctan2(src[1] - center[1], src[0] - center[0])
 
-def get_music_peak_KL(CovMat, array_2D, Angles, L=1):
+def get_music_peak_KL(CovMat, array_2D, Angles, L=1, refine=False):
     """
     MUSIC spektrumunda en büyük zirveyi (peak) bularak
     DoA (direction-of-arrival) açısını tahmin eder.
+    refine=True ise kaba ızgara sonucu refine_music_peaks ile iyileştirilir.
     """
-    N = array_2D.shape[0]
-    pspectrum = music(CovMat, L=L, N=N, array_2D=array_2D, Angles=Angles)
+    Qn = subspace_decomposition(CovMat, L)
+    pspectrum = music_spectrum(Qn, array_2D, Angles)
     
     # dB ölçeğine almak yerine basitçe zirveyi bulabiliriz;
     # istenirse log alınır vs.
     idx = np.argmax(pspectrum)
     doa_est = Angles[idx]
+    if refine:
+        doa_est = refine_music_peaks(Qn, array_2D, doa_est, _grid_step(Angles))[0]
     return doa_est
\ No newline at end of file
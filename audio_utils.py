@@ -0,0 +1,132 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from instrumentation import timed
+
+# Multichannel recordings are memory-mapped and processed in fixed-size
+# chunks of STFT frames, so memory use does not grow with the file length.
+
+def open_multichannel(path, num_channels=None, dtype="int16", sample_rate=None, offset=0):
+    """
+    Memory-map a multichannel recording without reading it into RAM.
+
+    Parameters:
+      path: .wav file (PCM or float) or headerless interleaved raw file
+      num_channels: channel count (raw files only)
+      dtype: sample type of a raw file, e.g. "int16", "int32", "float32"
+      sample_rate: sampling rate in Hz (raw files only)
+      offset: header size in bytes to skip (raw files only)
+
+    Returns (data, sample_rate) where data is a read-only (num_samples x N)
+    memmap in the file's own sample type; use to_float() on the blocks read.
+    """
+    if str(path).lower().endswith(".wav"):
+        from scipy.io import wavfile
+        sample_rate, data = wavfile.read(path, mmap=True)
+        if data.ndim == 1:
+            data = data[:, None]
+        return data, sample_rate
+
+    if num_channels is None or sample_rate is None:
+        raise ValueError("raw files need num_channels and sample_rate")
+    data = np.memmap(path, dtype=dtype, mode="r", offset=offset)
+    if data.size % num_channels:
+        raise ValueError(f"file size is not a multiple of {num_channels} channels")
+    return data.reshape(-1, num_channels), sample_rate
+
+def to_float(block):
+    """
+    Convert a block of integer PCM samples to float64 in [-1, 1).
+    Float blocks are only cast.
+    """
+    block = np.asarray(block)
+    if block.dtype == np.uint8:
+        return (block.astype(float) - 128.0) / 128.0
+    if np.issubdtype(block.dtype, np.integer):
+        return block.astype(float) / float(2 ** (8*block.dtype.itemsize - 1))
+    return block.astype(float)
+
+def stft_bins(sample_rate, nfft, fmin=None, fmax=None):
+    """
+    Indices and frequencies [Hz] of the rfft bins within [fmin, fmax].
+    """
+    freqs = np.fft.rfftfreq(nfft, 1.0 / sample_rate)
+    keep = np.ones(len(freqs), dtype=bool)
+    if fmin is not None:
+        keep &= freqs >= fmin
+    if fmax is not None:
+        keep &= freqs <= fmax
+    idx = np.flatnonzero(keep)
+    return idx, freqs[idx]
+
+def stft_chunks(data, nfft=512, hop=None, window="hann", bins=None, chunk_frames=64):
+    """
+    Streaming STFT of a (num_samples x N) signal.
+
+    Only the samples of one chunk (chunk_frames frames) are read and
+    converted at a time, so data can be a memmap of any size.
+
+    Parameters:
+      data: (num_samples x N) samples (array or memmap)
+      nfft: frame length
+      hop: frame advance (default nfft // 2)
+      window: window name for scipy.signal.get_window, or an nfft array
+      bins: rfft bin indices to keep (default all)
+      chunk_frames: frames per yielded chunk
+
+    Yields X with shape (F x N x T_chunk), F = number of kept bins.
+    """
+    hop = nfft // 2 if hop is None else hop
+    if isinstance(window, str):
+        import scipy.signal as ss
+        window = ss.get_window(window, nfft)
+    window = np.asarray(window, dtype=float)
+    num_frames = (len(data) - nfft) // hop + 1 if len(data) >= nfft else 0
+
+    for f0 in range(0, num_frames, chunk_frames):
+        T = min(chunk_frames, num_frames - f0)
+        start = f0 * hop
+        block = to_float(data[start:start + (T - 1)*hop + nfft])        # (S, N)
+        frames = sliding_window_view(block, nfft, axis=0)[::hop]       # (T, N, nfft)
+        X = np.fft.rfft(frames * window, axis=-1)                      # (T, N, nfft//2+1)
+        if bins is not None:
+            X = X[..., bins]
+        yield X.transpose(2, 1, 0)
+
+@timed("covariance")
+def stft_covariances(data, sample_rate, nfft=512, hop=None, fmin=None, fmax=None,
+                     window="hann", chunk_frames=64):
+    """
+    Per-frequency-bin spatial covariance matrices of a multichannel signal,
+    accumulated chunk by chunk over the streaming STFT.
+
+    R[f] = 1/T sum_t X[f, :, t] X[f, :, t]^H
+
+    With the numpy FFT sign convention a channel leading by tau seconds picks
+    up exp(+j 2 pi f tau), which matches the steering vectors of
+    array_utils for wavenumber(freqs[f]) with element positions in meters.
+
+    Returns:
+      freqs: (F,) bin frequencies [Hz]
+      R: (F x N x N) covariance matrices
+      num_frames: number of STFT frames averaged
+    """
+    bins, freqs = stft_bins(sample_rate, nfft, fmin, fmax)
+    N = data.shape[1]
+    R = np.zeros((len(bins), N, N), dtype=complex)
+    num_frames = 0
+    for X in stft_chunks(data, nfft, hop, window, bins, chunk_frames):
+        R += X @ X.conj().swapaxes(-1, -2)
+        num_frames += X.shape[-1]
+    if num_frames:
+        R /= num_frames
+    return freqs, R, num_frames
+
+def stft_covariances_file(path, nfft=512, hop=None, fmin=None, fmax=None, window="hann",
+                          chunk_frames=64, **raw_kwargs):
+    """
+    stft_covariances on a memory-mapped WAV/raw file (see open_multichannel
+    for the raw-file keyword arguments).
+    """
+    data, sample_rate = open_multichannel(path, **raw_kwargs)
+    return stft_covariances(data, sample_rate, nfft, hop, fmin, fmax, window, chunk_frames)
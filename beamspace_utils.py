@@ -0,0 +1,171 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.special import jv
+
+from array_utils import (DEFAULT_WAVENUMBER, PRECISIONS, real_dtype, complex_dtype, get_precision,
+                         subspace_decomposition, music_spectrum, refine_music_peaks, wrap_to_pi,
+                         _grid_step)
+from instrumentation import stage
+
+# Grid-free DoA estimation for uniform circular arrays (UCAs) in phase-mode
+# beamspace. With element angles gamma_n around the center and radius r,
+#   a_n(theta) ~ exp(j k r cos(theta - gamma_n)) = sum_m j^m J_m(k r) exp(j m (theta - gamma_n)),
+# so the orthonormal transform F[m, n] = exp(j m gamma_n) / sqrt(N),
+# m = -M..M, maps the manifold to b_m(theta) = sqrt(N) j^m J_m(k r) exp(j m theta)
+# up to a common phase (and aliasing of modes |m| > N - M, small for
+# M <= k r < N / 2). After removing j^m J_m(k r) this is a Vandermonde
+# vector in z = exp(j theta), so the DoAs follow from polynomial roots
+# (root-MUSIC) without any angle scan. F is orthonormal, so the beamspace
+# noise stays white and the eigendecomposition is a plain (2M+1) x (2M+1) one.
+
+def uca_geometry(array_2D, rtol=1e-6):
+    """
+    Center, radius and element angles (relative to the center) of a uniform
+    circular array such as generate_circular_array builds. Elements may be
+    in any order; raises ValueError if they are not equally spaced on a
+    circle.
+    """
+    array_2D = np.asarray(array_2D, dtype=float)
+    center = array_2D.mean(axis=0)
+    d = array_2D - center
+    radii = np.hypot(d[:, 0], d[:, 1])
+    radius = radii.mean()
+    gamma = np.arctan2(d[:, 1], d[:, 0])
+    N = len(array_2D)
+    gaps = np.diff(np.sort(gamma), append=np.sort(gamma)[0] + 2*np.pi)
+    if N < 3 or np.ptp(radii) > rtol * radius or np.ptp(gaps) > 2*np.pi / N * 1e-3:
+        raise ValueError("array_2D is not a uniform circular array")
+    return center, radius, gamma
+
+@lru_cache(maxsize=32)
+def _phase_mode_transform(array_bytes, shape, wavenumber, num_modes, precision):
+    """
+    Cached (modes, F (D x N), bessel (D,)) of a UCA.
+    """
+    _, radius, gamma = uca_geometry(np.frombuffer(array_bytes).reshape(shape))
+    N = len(gamma)
+    kr = wavenumber * radius
+    if num_modes is None:
+        num_modes = max(1, min(int(np.floor(kr)), (N - 1) // 2))
+    if not 1 <= num_modes <= (N - 1) // 2:
+        raise ValueError(f"num_modes={num_modes} must be in [1, {(N - 1) // 2}] for N={N}")
+    cdt = PRECISIONS[precision][1]
+    m = np.arange(-num_modes, num_modes + 1)
+    F = (np.exp(1j * m[:, None] * gamma[None, :]) / np.sqrt(N)).astype(cdt)
+    bessel = (1j**m * jv(m, kr)).astype(cdt)
+    for a in (m, F, bessel):
+        a.setflags(write=False)
+    return m, F, bessel
+
+def phase_mode_transform(array_2D, wavenumber=DEFAULT_WAVENUMBER, num_modes=None):
+    """
+    Phase-mode beamspace transform of a UCA (see the note at the top).
+
+    Parameters:
+      array_2D: N x 2 element positions of a uniform circular array
+      wavenumber: steering wavenumber (see array_response_vector_circular)
+      num_modes: highest mode order M; default min(floor(k r), (N - 1) // 2),
+                 at least 1 (small arrays at low frequencies, k r < 1)
+
+    Returns (modes, F, bessel): the mode orders -M..M, the D x N transform
+    (D = 2M + 1) and the factors j^m J_m(k r) with F a = bessel * z^m up to
+    a common phase. Cached per geometry, wavenumber and precision.
+    """
+    array_2D = np.ascontiguousarray(array_2D, dtype=float)
+    return _phase_mode_transform(array_2D.tobytes(), array_2D.shape, float(wavenumber),
+                                 None if num_modes is None else int(num_modes), get_precision())
+
+@lru_cache(maxsize=8)
+def _diagonal_sums(D):
+    """
+    (D*D, 2D-1) 0/1 matrix summing C[p, q] into the coefficient of z^(q-p),
+    highest power first.
+    """
+    p, q = np.divmod(np.arange(D * D), D)
+    S = np.zeros((D * D, 2*D - 1))
+    S[np.arange(D * D), (D - 1) - (q - p)] = 1.0
+    S.setflags(write=False)
+    return S
+
+def _root_music(En, bessel, L):
+    """
+    For a stack of beamspace noise subspaces En (B, D, D-L), the L roots of
+    each root-MUSIC polynomial inside and closest to the unit circle (B, L),
+    NaN where fewer exist. The roots of all B polynomials are the
+    eigenvalues of one stack of companion matrices.
+    """
+    # En^H b(theta) = 0 with b = bessel * v(z)  ->  G^H v(z) = 0, G = conj(bessel) En
+    G = bessel.conj()[:, None] * En
+    C = G @ G.conj().swapaxes(-1, -2)
+    B, D = C.shape[:2]
+    coef = C.reshape(B, D * D) @ _diagonal_sums(D).astype(C.dtype)       # (B, 2D-1)
+    n = 2*D - 2
+    companion = np.zeros((B, n, n), dtype=C.dtype)
+    companion[:, 0, :] = -coef[:, 1:] / coef[:, :1]
+    companion[:, np.arange(1, n), np.arange(n - 1)] = 1.0
+    z = np.linalg.eigvals(companion)
+    dist = np.where(np.abs(z) < 1, 1 - np.abs(z), np.inf)
+    order = np.argsort(dist, axis=-1)[:, :L]
+    z = np.take_along_axis(z, order, axis=-1)
+    return np.where(np.isfinite(np.take_along_axis(dist, order, axis=-1)), z, np.nan)
+
+def beamspace_doas(CovMats, L, array_2D, wavenumber=DEFAULT_WAVENUMBER, num_modes=None):
+    """
+    Grid-free root-MUSIC DoA estimates of L sources from a stack of
+    covariance matrices of one UCA.
+
+    Parameters:
+      CovMats: (..., N, N) covariance matrices
+      L: number of sources
+      array_2D: N x 2 element positions (uniform circular array)
+      wavenumber: steering wavenumber, e.g. array_utils.wavenumber(freq)
+      num_modes: highest phase mode M (see phase_mode_transform)
+
+    Returns (..., L) DoAs in radians sorted by angle (NaN where fewer
+    roots were found).
+
+    Root-MUSIC keeps a small bias from the aliased modes (about 0.08° on
+    the 16-element, one-wavelength arrays of the demos), which is above the
+    tolerance of refine_music_peaks; use get_beamspace_peaks(refine=True)
+    when that matters.
+    """
+    m, F, bessel = phase_mode_transform(array_2D, wavenumber, num_modes)
+    CovMats = np.asarray(CovMats, dtype=complex_dtype())
+    D = len(m)
+    if not 0 < L < D:
+        raise ValueError(f"number of sources L={L} must satisfy 0 < L < {D} phase modes")
+    with stage("eigendecomposition"):
+        Rb = F @ CovMats @ F.conj().T
+        _, E = np.linalg.eigh(Rb)                                  # ascending
+    with stage("find_peaks"):
+        En = E[..., :D - L].reshape((-1, D, D - L))
+        z = _root_music(En, bessel, L).reshape(E.shape[:-2] + (L,))
+    doas = np.angle(z).astype(real_dtype())
+    return np.sort(doas, axis=-1)
+
+def get_beamspace_peaks(CovMat, L, N, array_2D, Angles, refine=False,
+                        wavenumber=DEFAULT_WAVENUMBER, num_modes=None):
+    """
+    Drop-in alternative to get_music_peaks for uniform circular arrays: the
+    DoAs come from beamspace root-MUSIC (see beamspace_doas) instead of a
+    peak search over Angles.
+
+    With refine=True the closed-form estimates are polished on the element-
+    space MUSIC spectrum with refine_music_peaks (window of ±1 grid step of
+    Angles).
+
+    Returns (doa_sorted, pidx, pspectrum) like get_music_peaks: pidx are the
+    nearest indices in Angles and pspectrum is the MUSIC spectrum over
+    Angles (music_spectrum), for plots or further peak picking.
+    """
+    doas = beamspace_doas(CovMat, L, array_2D, wavenumber, num_modes)
+    doas = doas[np.isfinite(doas)]
+    Angles = np.asarray(Angles)
+    Qn = subspace_decomposition(CovMat, L)
+    if refine and len(doas):
+        doas = np.sort(refine_music_peaks(Qn, array_2D, doas, _grid_step(Angles),
+                                          wavenumber=wavenumber))
+    pspectrum = music_spectrum(Qn, array_2D, Angles, wavenumber)
+    pidx = np.argmin(np.abs(wrap_to_pi(Angles[None, :] - doas[:, None])), axis=1)
+    return doas, pidx, pspectrum
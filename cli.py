@@ -0,0 +1,77 @@
+import argparse
+import time
+
+import numpy as np
+
+from pipeline import SCENARIOS, SUBSPACE_METHODS, save_result
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Run the localization demo scenarios headless.")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS),
+                        help="intersection (main.py), kf (KF/main.py) or ekf (EKF/main.py)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed (default: the demo script's seed)")
+    parser.add_argument("--snr", type=float, default=None, help="linear SNR")
+    parser.add_argument("--snapshots", type=int, default=None, help="snapshots per frame")
+    parser.add_argument("--grid", type=int, default=None, help="MUSIC scan grid size")
+    parser.add_argument("--steps", type=int, default=None, help="frames (kf/ekf only)")
+    parser.add_argument("--subspace", choices=SUBSPACE_METHODS, default=None,
+                        help="per-frame eigendecomposition or PASTd subspace tracking "
+                             "(kf/ekf only)")
+    parser.add_argument("--out", default=None,
+                        help="write estimates, spectra and tracks to a .json or .npz file")
+    parser.add_argument("--plot", action="store_true", help="show matplotlib figures")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    kwargs = {}
+    if args.seed is not None:
+        kwargs["seed"] = args.seed
+    if args.snr is not None:
+        kwargs["snr"] = args.snr
+    if args.snapshots is not None:
+        kwargs["num_snapshot"] = args.snapshots
+    if args.grid is not None:
+        kwargs["grid_size"] = args.grid
+    if args.steps is not None:
+        if args.scenario == "intersection":
+            raise SystemExit("--steps only applies to the kf and ekf scenarios")
+        kwargs["num_steps"] = args.steps
+    if args.subspace is not None:
+        if args.scenario == "intersection":
+            raise SystemExit("--subspace only applies to the kf and ekf scenarios")
+        kwargs["subspace"] = args.subspace
+
+    start = time.perf_counter()
+    result = SCENARIOS[args.scenario](**kwargs)
+    elapsed = time.perf_counter() - start
+
+    if args.scenario == "intersection":
+        print("True sources:\n", np.round(result["src_positions"], 2))
+        print("Estimates:\n", np.round(result["estimates"], 2))
+    else:
+        final = result["track"][-1]
+        err = np.linalg.norm(final - result["src_position"])
+        print(f"True source: {np.round(result['src_position'], 2)}  "
+              f"final estimate: {np.round(final, 2)}  error: {err:.3f} m")
+    print(f"{args.scenario} scenario ran in {elapsed*1e3:.1f} ms")
+
+    if args.out:
+        save_result(result, args.out)
+        print(f"Results written to {args.out}")
+
+    if args.plot:
+        import plotting
+        if args.scenario == "intersection":
+            plotting.plot_intersection(result)
+        elif args.scenario == "kf":
+            plotting.plot_track(result, "Multiple Arrays + MUSIC -> (x,y) Measurement + Linear KF",
+                                "KF Estimate")
+        else:
+            plotting.plot_track(result, "Source Position Tracking with EKF", "EKF Estimated Path")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.linalg.blas import get_blas_funcs
+
+from array_utils import complex_dtype
+
+# Covariances H @ H^H are Hermitian, so only the upper triangle is kept:
+# N (N + 1) / 2 complex entries per matrix instead of N^2, row by row
+# (R[0, 0], R[0, 1], ..., R[0, N-1], R[1, 1], ...). They are accumulated with
+# the BLAS rank-k update ?herk, which only computes one triangle, and only
+# expanded to the full matrix when an eigensolver needs it.
+
+def packed_size(N):
+    """
+    Number of packed entries of an N x N Hermitian matrix.
+    """
+    return N * (N + 1) // 2
+
+def _packed_dim(P):
+    N = int(round((np.sqrt(8*P + 1) - 1) / 2))
+    if packed_size(N) != P:
+        raise ValueError(f"{P} is not a packed Hermitian size N (N + 1) / 2")
+    return N
+
+@lru_cache(maxsize=16)
+def _triu(N):
+    iu, ju = np.triu_indices(N)
+    iu.setflags(write=False)
+    ju.setflags(write=False)
+    return iu, ju
+
+def pack_hermitian(R):
+    """
+    Packed upper triangle (..., N (N + 1) / 2) of (..., N, N) Hermitian matrices.
+    """
+    R = np.asarray(R)
+    iu, ju = _triu(R.shape[-1])
+    return R[..., iu, ju]
+
+def unpack_hermitian(packed):
+    """
+    Full (..., N, N) Hermitian matrices from packed upper triangles.
+    """
+    packed = np.asarray(packed)
+    N = _packed_dim(packed.shape[-1])
+    iu, ju = _triu(N)
+    R = np.empty(packed.shape[:-1] + (N, N), dtype=packed.dtype)
+    R[..., ju, iu] = packed.conj()
+    R[..., iu, ju] = packed
+    return R
+
+def herk_packed(H, out=None):
+    """
+    Packed covariance H @ H^H of (..., N, T) snapshot blocks via ?herk.
+
+    The C-ordered (N, T) block is passed to BLAS as its Fortran-ordered
+    transpose, so no copy is made; herk then returns conj(H H^H) whose upper
+    triangle is conjugated back. If out (..., N (N + 1) / 2) is given, the
+    result is added to it.
+    """
+    H = np.asarray(H, dtype=complex_dtype())
+    N = H.shape[-2]
+    iu, ju = _triu(N)
+    herk = get_blas_funcs("herk", (H,))
+    if out is None:
+        out = np.zeros(H.shape[:-2] + (packed_size(N),), dtype=H.dtype)
+    for idx in np.ndindex(H.shape[:-2]):
+        C = herk(1.0, np.ascontiguousarray(H[idx]).T, trans=2)
+        out[idx] += C[iu, ju].conj()
+    return out
+
+class PackedCovariance:
+    """
+    Stack of Hermitian covariance matrices (shape + (N, N)) stored as packed
+    upper triangles, with the same H @ H^H scaling as simulate_covmats.
+
+    update(H) adds the snapshot blocks H (shape + (N, T)) with a rank-k
+    update. The full matrices are only built on demand (unpack(), or
+    np.asarray(cov) so the object can be passed to subspace_decomposition,
+    get_music_peaks, get_music_peaks_batch, ...) and cached until the next
+    update. Indexing over the stack dimensions returns a PackedCovariance;
+    with basic indexing it is a view sharing the packed data, and an
+    update through either object invalidates the cached matrices of both.
+    """
+    def __init__(self, N, shape=(), dtype=None, packed=None, num_snapshots=0):
+        self.N = int(N)
+        if packed is None:
+            dtype = complex_dtype() if dtype is None else dtype
+            packed = np.zeros(tuple(shape) + (packed_size(self.N),), dtype=dtype)
+        self.packed = packed
+        self.num_snapshots = num_snapshots
+        self._full = None
+        # views made by __getitem__ share the root's version counter
+        self._root = self
+        self._version = 0
+        self._full_version = -1
+
+    @classmethod
+    def from_matrices(cls, R, num_snapshots=0):
+        """
+        Pack existing (..., N, N) Hermitian matrices.
+        """
+        R = np.asarray(R)
+        return cls(R.shape[-1], packed=pack_hermitian(R), num_snapshots=num_snapshots)
+
+    @classmethod
+    def from_snapshots(cls, H):
+        """
+        Covariance of (..., N, T) snapshot blocks.
+        """
+        H = np.asarray(H)
+        return cls(H.shape[-2], packed=herk_packed(H), num_snapshots=H.shape[-1])
+
+    @property
+    def shape(self):
+        return self.packed.shape[:-1] + (self.N, self.N)
+
+    @property
+    def dtype(self):
+        return self.packed.dtype
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, idx):
+        packed = self.packed[idx]
+        if packed.ndim == 0 or packed.shape[-1] != self.packed.shape[-1]:
+            raise IndexError("only the stack dimensions can be indexed")
+        view = PackedCovariance(self.N, packed=packed, num_snapshots=self.num_snapshots)
+        if np.shares_memory(packed, self.packed):
+            view._root = self._root
+        return view
+
+    def update(self, H):
+        """
+        Accumulate snapshot blocks H (shape + (N, T)) into the stack.
+        """
+        H = np.asarray(H)
+        if H.shape[:-1] != self.packed.shape[:-1] + (self.N,):
+            raise ValueError(f"expected snapshots of shape {self.shape[:-1]} + (T,), "
+                             f"got {H.shape}")
+        herk_packed(H, out=self.packed)
+        self.num_snapshots += H.shape[-1]
+        self._root._version += 1
+        return self
+
+    def unpack(self):
+        """
+        Full (read-only) covariance matrices, cached until the next update.
+        """
+        if self._full is None or self._full_version != self._root._version:
+            self._full = unpack_hermitian(self.packed)
+            self._full.setflags(write=False)
+            self._full_version = self._root._version
+        return self._full
+
+    def __array__(self, dtype=None, copy=None):
+        R = self.unpack()
+        if dtype is not None and np.dtype(dtype) != R.dtype:
+            return R.astype(dtype)
+        return R.copy() if copy else R
+
+    def save(self, path, compress=False, **metadata):
+        """
+        Write the packed stack (and extra arrays such as freqs) to an .npz file.
+        """
+        savez = np.savez_compressed if compress else np.savez
+        savez(path, packed=self.packed, N=self.N, num_snapshots=self.num_snapshots,
+              **metadata)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a stack written by save(). Returns (PackedCovariance, metadata).
+        """
+        with np.load(path) as f:
+            metadata = {k: f[k] for k in f.files if k not in ("packed", "N", "num_snapshots")}
+            cov = cls(int(f["N"]), packed=f["packed"], num_snapshots=int(f["num_snapshots"]))
+        return cov, metadata
@@ -1,4 +1,12 @@
+import warnings
+from functools import lru_cache
+from itertools import combinations
+
 import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, linear_sum_assignment, milp
+
+from array_utils import default_rng, real_dtype
+from instrumentation import timed
 
 def is_point_in_polygon(point, polygon):
     """
@@ -18,23 +26,375 @@ def is_point_in_polygon(point, polygon):
                 inside = not inside
     return inside
 
-def generate_random_points_in_polygon(poly, L):
+def points_in_polygon(points, polygon, chunk_size=65536):
+    """
+    Vectorized ray-casting test for many points at once.
+
+    points: (..., 2) query points
+    polygon: closed polygon (first vertex repeated at the end), as used by
+             is_point_in_polygon; non-convex polygons are fine
+    Returns a boolean array of shape points.shape[:-1]. The K points x E
+    edges crossing table is evaluated in chunks of chunk_size points.
+    """
+    points = np.asarray(points, dtype=float)
+    pts = points.reshape(-1, 2)
+    poly = np.asarray(polygon, dtype=float)
+    x1, y1 = poly[:-1, 0], poly[:-1, 1]
+    x2, y2 = poly[1:, 0], poly[1:, 1]
+    dy = y2 - y1
+    slope = np.divide(x2 - x1, dy, out=np.zeros_like(dy), where=dy != 0)
+
+    inside = np.empty(len(pts), dtype=bool)
+    for start in range(0, len(pts), chunk_size):
+        x = pts[start:start + chunk_size, 0, None]
+        y = pts[start:start + chunk_size, 1, None]
+        straddle = (y1 > y) != (y2 > y)
+        x_intersect = x1 + (y - y1) * slope
+        crossings = np.count_nonzero(straddle & (x_intersect > x), axis=1)
+        inside[start:start + chunk_size] = crossings % 2 == 1
+    return inside.reshape(points.shape[:-1])
+
+def triangulate_polygon(poly):
+    """
+    Triangulate a simple (possibly non-convex) polygon by ear clipping.
+    A repeated closing vertex is ignored.
+    Returns a (V-2, 3, 2) array of triangle vertices.
+    """
+    pts = np.asarray(poly, dtype=float)
+    if len(pts) > 1 and np.allclose(pts[0], pts[-1]):
+        pts = pts[:-1]
+    # Work counter-clockwise
+    area2 = np.sum(pts[:, 0] * np.roll(pts[:, 1], -1) - np.roll(pts[:, 0], -1) * pts[:, 1])
+    if area2 < 0:
+        pts = pts[::-1]
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    idx = list(range(len(pts)))
+    triangles = []
+    while len(idx) > 3:
+        for k in range(len(idx)):
+            i0, i1, i2 = idx[k - 1], idx[k], idx[(k + 1) % len(idx)]
+            a, b, c = pts[i0], pts[i1], pts[i2]
+            if cross(a, b, c) <= 0:
+                continue                        # reflex or degenerate corner
+            # No other remaining vertex may lie inside the candidate ear
+            if any(cross(a, b, pts[j]) >= 0 and cross(b, c, pts[j]) >= 0 and
+                   cross(c, a, pts[j]) >= 0
+                   for j in idx if j not in (i0, i1, i2)):
+                continue
+            triangles.append((a, b, c))
+            del idx[k]
+            break
+        else:
+            raise ValueError("polygon is not simple; ear clipping failed")
+    triangles.append(tuple(pts[idx]))
+    return np.array(triangles)
+
+@lru_cache(maxsize=16)
+def _polygon_triangles(poly_bytes, shape):
+    """
+    Cached triangulation and triangle areas of a polygon (keyed by its bytes).
+    """
+    tris = triangulate_polygon(np.frombuffer(poly_bytes).reshape(shape))
+    e1 = tris[:, 1] - tris[:, 0]
+    e2 = tris[:, 2] - tris[:, 0]
+    areas = 0.5 * np.abs(e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0])
+    return tris, areas
+
+def generate_random_points_in_polygon(poly, L, rng=None, min_wall_distance=0.0):
     """
     Generate L random points inside the given polygon.
+
+    The polygon is triangulated once (and cached); points are then drawn
+    directly, choosing a triangle with probability proportional to its area
+    and a uniform point inside it, so no candidate is ever rejected.
+    rng is an optional numpy.random.Generator.
+
+    With min_wall_distance > 0 only points at least that far from every
+    wall are kept (checked with the cached RoomIndex of the polygon), and
+    rejected points are redrawn.
     """
-    minx = np.min(poly[:,0])
-    maxx = np.max(poly[:,0])
-    miny = np.min(poly[:,1])
-    maxy = np.max(poly[:,1])
-    
-    points = []
-    while len(points) < L:
-        xr = np.random.uniform(minx, maxx)
-        yr = np.random.uniform(miny, maxy)
-        if is_point_in_polygon((xr, yr), poly):
-            points.append([xr, yr])
-    return np.array(points)
+    rng = default_rng(rng)
+    poly = np.ascontiguousarray(poly.polygon if isinstance(poly, RoomIndex) else poly,
+                                dtype=float)
+    tris, areas = _polygon_triangles(poly.tobytes(), poly.shape)
+
+    def draw(n):
+        k = rng.choice(len(tris), size=n, p=areas / areas.sum())
+        u = rng.random((n, 2))
+        # Fold points of the unit square into the lower triangle
+        flip = u.sum(axis=1) > 1.0
+        u[flip] = 1.0 - u[flip]
+        a, b, c = tris[k, 0], tris[k, 1], tris[k, 2]
+        return a + u[:, :1] * (b - a) + u[:, 1:] * (c - a)
+
+    if min_wall_distance <= 0:
+        return draw(L)
+    room = room_index(poly)
+    points = np.zeros((0, 2))
+    for _ in range(100):
+        cand = draw(2 * (L - len(points)) + 8)
+        cand = cand[room.distance_to_wall(cand) >= min_wall_distance]
+        points = np.vstack([points, cand])[:L]
+        if len(points) == L:
+            return points
+    raise ValueError(f"no room left {min_wall_distance} away from the walls")
+
+class RoomIndex:
+    """
+    Precomputed spatial index of a room polygon for fast point queries.
+
+    The polygon's bounding box is rasterized into square cells of size
+    cell_size. Every cell is classified as inside, outside or boundary (some
+    edge crosses it); boundary cells keep a bucket of the crossing edges and
+    the exact inside/outside state of their center, so a point in a boundary
+    cell is resolved by counting crossings between the point and the cell
+    center. Every cell also keeps the few edges that can be nearest to any
+    point of the cell, which makes distance-to-wall exact as well.
+
+    Use room_index(polygon) to get a cached instance per polygon.
+    """
+    OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+
+    def __init__(self, polygon, cell_size=None, chunk_size=65536):
+        poly = np.asarray(polygon, dtype=float)
+        if not np.allclose(poly[0], poly[-1]):
+            poly = np.vstack([poly, poly[:1]])
+        self.polygon = poly
+        self.p0 = poly[:-1]
+        self.p1 = poly[1:]
+        self.chunk_size = chunk_size
+
+        lo, hi = poly.min(axis=0), poly.max(axis=0)
+        if cell_size is None:
+            cell_size = max(hi - lo) / 256.0
+        self.cell_size = h = float(cell_size)
+        self.origin = lo
+        self.shape = (int(np.ceil((hi[1] - lo[1]) / h)) or 1,
+                      int(np.ceil((hi[0] - lo[0]) / h)) or 1)      # (ny, nx)
+        ny, nx = self.shape
+        iy, ix = np.mgrid[0:ny, 0:nx]
+        cell_centers = lo + h * (np.stack([ix, iy], axis=-1).reshape(-1, 2) + 0.5)
+        self._cell_centers = cell_centers
+
+        # Edge buckets of the cells each edge passes through
+        pairs = [(self._cells_on_segment(a, b), e)
+                 for e, (a, b) in enumerate(zip(self.p0, self.p1))]
+        cells = np.concatenate([c for c, _ in pairs])
+        edges = np.concatenate([np.full(len(c), e) for c, e in pairs])
+        self._edge_bucket = self._pad(cells, edges, ny * nx)
+        center_inside = points_in_polygon(cell_centers, poly, chunk_size)
+        codes = np.where(center_inside, self.INSIDE, self.OUTSIDE)
+        codes[self._edge_bucket[:, 0] >= 0] = self.BOUNDARY
+        self.codes = codes.reshape(ny, nx).astype(np.uint8)
+        self._center_inside = center_inside
+
+        # Candidate nearest edges: every edge whose distance to the cell
+        # center is within (nearest distance + 2 * half diagonal)
+        r = h * np.sqrt(0.5)
+        near = np.zeros((ny * nx, len(self.p0)), dtype=bool)
+        for start in range(0, len(cell_centers), chunk_size):
+            d = self._segment_distances(cell_centers[start:start + chunk_size, None, :],
+                                        self.p0, self.p1)
+            near[start:start + chunk_size] = d <= d.min(axis=1, keepdims=True) + 2 * r
+        cells, edges = np.nonzero(near)
+        cand = self._pad(cells, edges, ny * nx)
+        # Pad with the cell's first candidate, which leaves the minimum unchanged
+        self._wall_candidates = np.where(cand >= 0, cand, cand[:, :1])
+
+        d = self.p1 - self.p0
+        self._edge_x, self._edge_y = self.p0[:, 0].copy(), self.p0[:, 1].copy()
+        self._edge_dx, self._edge_dy = d[:, 0].copy(), d[:, 1].copy()
+        self._edge_inv_len2 = 1.0 / np.maximum(np.sum(d * d, axis=1), np.finfo(float).tiny)
+
+    @staticmethod
+    def _pad(cells, values, num_cells):
+        """
+        Per-cell lists of values as a (num_cells, width) table padded with -1.
+        """
+        order = np.lexsort((values, cells))
+        cells, values = cells[order], values[order]
+        counts = np.bincount(cells, minlength=num_cells)
+        starts = np.cumsum(counts) - counts
+        out = np.full((num_cells, max(1, counts.max(initial=0))), -1, dtype=np.intp)
+        out[cells, np.arange(len(cells)) - starts[cells]] = values
+        return out
+
+    def _cells_on_segment(self, a, b):
+        """
+        Flat indices of the cells whose closed square meets segment a-b.
+        """
+        h, lo = self.cell_size, self.origin
+        ny, nx = self.shape
+        (x0, y0), (x1, y1) = np.minimum(a, b), np.maximum(a, b)
+        i0, i1 = np.clip(np.floor(([x0, x1] - lo[0]) / h).astype(int), 0, nx - 1)
+        j0, j1 = np.clip(np.floor(([y0, y1] - lo[1]) / h).astype(int), 0, ny - 1)
+        jy, ix = np.mgrid[j0:j1 + 1, i0:i1 + 1]
+        # Separating axis along the edge normal: the cell is hit when its
+        # corners are not all strictly on one side of the edge's line
+        n = np.array([-(b[1] - a[1]), b[0] - a[0]])
+        corners = lo + h * np.stack([ix, jy], axis=-1)[..., None, :] + \
+            h * np.array([[0, 0], [1, 0], [0, 1], [1, 1]])
+        side = (corners - a) @ n
+        hit = ~(np.all(side > 0, axis=-1) | np.all(side < 0, axis=-1))
+        return (jy * nx + ix)[hit]
+
+    @staticmethod
+    def _segment_distances(pts, p0, p1):
+        """
+        Distance from pts (..., 2) to segments p0-p1 (broadcast over the
+        edge axis).
+        """
+        d = p1 - p0
+        dd = np.maximum(np.sum(d * d, axis=-1), np.finfo(float).tiny)
+        t = np.clip(np.sum((pts - p0) * d, axis=-1) / dd, 0.0, 1.0)
+        return np.linalg.norm(pts - (p0 + t[..., None] * d), axis=-1)
+
+    def _cell_of(self, pts):
+        ij = np.floor((pts - self.origin) / self.cell_size).astype(np.intp)
+        ny, nx = self.shape
+        in_grid = (ij[:, 0] >= 0) & (ij[:, 0] < nx) & (ij[:, 1] >= 0) & (ij[:, 1] < ny)
+        flat = np.where(in_grid, ij[:, 1] * nx + ij[:, 0], 0)
+        return flat, in_grid
+
+    def contains(self, points):
+        """
+        Exact point-in-room test, same convention as points_in_polygon,
+        including points on the walls (the ray-casting rule keeps e.g. the
+        left and bottom walls of an axis-aligned room and drops the right
+        and top ones).
+        points: (..., 2); returns a boolean array of shape points.shape[:-1].
+        """
+        points = np.asarray(points, dtype=float)
+        pts = points.reshape(-1, 2)
+        inside = np.zeros(len(pts), dtype=bool)
+        for start in range(0, len(pts), self.chunk_size):
+            inside[start:start + self.chunk_size] = self._contains(pts[start:start + self.chunk_size])
+        return inside.reshape(points.shape[:-1])
+
+    def _contains(self, pts):
+        flat, in_grid = self._cell_of(pts)
+        code = np.where(in_grid, self.codes.ravel()[flat], self.OUTSIDE)
+        inside = code == self.INSIDE
+        bnd = np.flatnonzero(code == self.BOUNDARY)
+        if len(bnd) == 0:
+            return inside
+        # Parity of edge crossings on the segment point -> cell center
+        q = pts[bnd, None, :]
+        c = self._cell_centers[flat[bnd], None, :]
+        edges = self._edge_bucket[flat[bnd]]
+        valid = edges >= 0
+        a, b = self.p0[edges], self.p1[edges]
+
+        def orient(o, u, v):
+            return ((u[..., 0] - o[..., 0]) * (v[..., 1] - o[..., 1]) -
+                    (u[..., 1] - o[..., 1]) * (v[..., 0] - o[..., 0]))
+        qca, qcb, abq = orient(q, c, a), orient(q, c, b), orient(a, b, q)
+        straddle_qc = (qca > 0) != (qcb > 0)
+        straddle_ab = (abq > 0) != (orient(a, b, c) > 0)
+        crossings = np.count_nonzero(valid & straddle_qc & straddle_ab, axis=1)
+        inside[bnd] = self._center_inside[flat[bnd]] ^ (crossings % 2 == 1)
+        # Points on (or within rounding of) an edge's line and segments
+        # through a vertex: the parity is ambiguous there, so apply the
+        # ray-casting rule itself
+        tol = 1e-9 * self.cell_size
+        ab_len = np.hypot(b[..., 0] - a[..., 0], b[..., 1] - a[..., 1])
+        qc_len = np.hypot(c[..., 0] - q[..., 0], c[..., 1] - q[..., 1])
+        degenerate = np.any(valid & ((np.abs(abq) <= tol * ab_len) |
+                                     (np.abs(qca) <= tol * qc_len) |
+                                     (np.abs(qcb) <= tol * qc_len)), axis=1)
+        if degenerate.any():
+            idx = bnd[degenerate]
+            inside[idx] = points_in_polygon(pts[idx], self.polygon)
+        return inside
+
+    def distance_to_wall(self, points):
+        """
+        Euclidean distance from each point to the nearest wall segment.
+        points: (..., 2); returns an array of shape points.shape[:-1].
+        """
+        points = np.asarray(points, dtype=float)
+        pts = points.reshape(-1, 2)
+        dist = np.empty(len(pts))
+        for start in range(0, len(pts), self.chunk_size):
+            chunk = pts[start:start + self.chunk_size]
+            flat, in_grid = self._cell_of(chunk)
+            e = self._wall_candidates[flat]                           # (P, K)
+            px = chunk[:, 0, None] - self._edge_x[e]
+            py = chunk[:, 1, None] - self._edge_y[e]
+            dx, dy = self._edge_dx[e], self._edge_dy[e]
+            t = np.clip((px * dx + py * dy) * self._edge_inv_len2[e], 0.0, 1.0)
+            px -= t * dx
+            py -= t * dy
+            d = np.sqrt(np.min(px * px + py * py, axis=1))
+            if not in_grid.all():
+                # Outside the raster: check every edge
+                out = ~in_grid
+                d[out] = self._segment_distances(chunk[out, None, :],
+                                                 self.p0, self.p1).min(axis=1)
+            dist[start:start + self.chunk_size] = d
+        return dist.reshape(points.shape[:-1])
+
+    def signed_distance(self, points):
+        """
+        Distance to the nearest wall, positive inside the room and negative
+        outside.
+        """
+        d = self.distance_to_wall(points)
+        return np.where(self.contains(points), d, -d)
+
+    def clip(self, points):
+        """
+        Copy of points (..., 2) with every point outside the room moved onto
+        its nearest wall point and 1e-3 cell sizes further in, so that
+        contains() keeps it.
+        """
+        points = np.array(points, dtype=float)
+        pts = points.reshape(-1, 2)
+        out = np.flatnonzero(~self.contains(pts))
+        if len(out) == 0:
+            return points
+        q = pts[out, None, :]
+        d = self.p1 - self.p0
+        t = np.clip(np.sum((q - self.p0) * d, axis=-1) * self._edge_inv_len2, 0.0, 1.0)
+        foot = self.p0 + t[..., None] * d                                 # (P, E, 2)
+        e = np.argmin(np.sum((q - foot)**2, axis=-1), axis=1)
+        wall = foot[np.arange(len(out)), e]
+        step = wall - pts[out]
+        norm = np.linalg.norm(step, axis=1, keepdims=True)
+        # Points exactly on a dropped wall step along its inward normal
+        area2 = np.sum(self.p0[:, 0] * self.p1[:, 1] - self.p1[:, 0] * self.p0[:, 1])
+        inward = np.sign(area2) * np.stack([-d[e, 1], d[e, 0]], axis=-1)
+        step = np.where(norm > 0, step, inward)
+        step /= np.linalg.norm(step, axis=1, keepdims=True)
+        pts[out] = wall + 1e-3 * self.cell_size * step
+        return points
+
+@lru_cache(maxsize=16)
+def _room_index(poly_bytes, shape, cell_size):
+    return RoomIndex(np.frombuffer(poly_bytes).reshape(shape), cell_size)
+
+def room_index(polygon, cell_size=None):
+    """
+    RoomIndex of a polygon, built once and cached per polygon and cell size.
+    A RoomIndex passed in is returned as is.
+    """
+    if isinstance(polygon, RoomIndex):
+        return polygon
+    poly = np.ascontiguousarray(polygon, dtype=float)
+    return _room_index(poly.tobytes(), poly.shape, cell_size)
+
+def contains_points(room, points):
+    """
+    Point-in-room test for a polygon or a RoomIndex.
+    """
+    if isinstance(room, RoomIndex):
+        return room.contains(points)
+    return points_in_polygon(points, room)
 
+@timed("triangulation")
 def line_intersection_2d(p0, theta0, p1, theta1):
     """
     Find the 2D intersection point of two lines defined by:
@@ -50,13 +410,16 @@ def line_intersection_2d(p0, theta0, p1, theta1):
       p1: (x1, y1) center of array 2
       theta1: angle from measurement 2
     """
-    v0 = np.array([np.cos(theta0), np.sin(theta0)])
-    v1 = np.array([np.cos(theta1), np.sin(theta1)])
+    rdt = real_dtype()
+    p0 = np.asarray(p0, dtype=rdt)
+    p1 = np.asarray(p1, dtype=rdt)
+    v0 = np.array([np.cos(theta0), np.sin(theta0)], dtype=rdt)
+    v1 = np.array([np.cos(theta1), np.sin(theta1)], dtype=rdt)
     
     A = np.array([[v0[0], -v1[0]],
-                  [v0[1], -v1[1]]], dtype=float)
+                  [v0[1], -v1[1]]], dtype=rdt)
     b = np.array([p1[0] - p0[0],
-                  p1[1] - p0[1]], dtype=float)
+                  p1[1] - p0[1]], dtype=rdt)
     
     detA = np.linalg.det(A)
     if abs(detA) < 1e-10:
@@ -68,3 +431,246 @@ def line_intersection_2d(p0, theta0, p1, theta1):
     
     intersec = p0 + t * v0
     return intersec
+
+
+def intersect_bearing_pairs(p0, thetas0, p1, thetas1):
+    """
+    Intersect every bearing of array 0 with every bearing of array 1 at once.
+
+      line0_i: p0 + t_ij * [cos(thetas0[i]), sin(thetas0[i])]
+      line1_j: p1 + s_ij * [cos(thetas1[j]), sin(thetas1[j])]
+
+    The 2x2 systems of line_intersection_2d are solved in closed form
+    (Cramer's rule) for all L0 x L1 pairs.
+
+    Returns:
+      points: (L0, L1, 2) intersection points (NaN where the lines are parallel)
+      t, s:   (L0, L1) ranges along each bearing; negative values mean the
+              intersection lies behind the corresponding array
+    """
+    rdt = real_dtype()
+    p0 = np.asarray(p0, dtype=rdt)
+    p1 = np.asarray(p1, dtype=rdt)
+    th0 = np.asarray(thetas0, dtype=rdt)[:, None]
+    th1 = np.asarray(thetas1, dtype=rdt)[None, :]
+    v0x, v0y = np.cos(th0), np.sin(th0)
+    v1x, v1y = np.cos(th1), np.sin(th1)
+    bx, by = p1 - p0
+
+    detA = v1x * v0y - v0x * v1y
+    parallel = np.abs(detA) < 1e-10
+    with np.errstate(divide='ignore', invalid='ignore'):
+        det_safe = np.where(parallel, np.nan, detA)
+        t = (v1x * by - v1y * bx) / det_safe
+        s = (v0x * by - v0y * bx) / det_safe
+
+    points = np.stack([p0[0] + t * v0x, p0[1] + t * v0y], axis=-1)
+    return points, t, s
+
+def _bearing_residuals(points, center, thetas):
+    """
+    Absolute angular differences between the bearings thetas seen from
+    center and the directions to points (..., 2), broadcast together.
+    """
+    pred = np.arctan2(points[..., 1] - center[1], points[..., 0] - center[0])
+    return np.abs((thetas - pred + np.pi) % (2*np.pi) - np.pi)
+
+def _refine_positions(centers, doas, assoc):
+    """
+    Least-squares positions (K, 2) from the bearings selected by assoc (K, M)
+    (normal form n_m . X = n_m . p_m with n_m = [-sin, cos], as in
+    position_estimation).
+    """
+    used = assoc >= 0                                               # (K, M)
+    th = np.zeros(assoc.shape, dtype=centers.dtype)
+    for m in range(len(doas)):
+        th[used[:, m], m] = doas[m][assoc[used[:, m], m]]
+    n = np.stack([-np.sin(th), np.cos(th)], axis=-1) * used[..., None]
+    c = np.sum(n * centers, axis=-1)
+    ATA = np.einsum('kmi,kmj->kij', n, n)
+    ATb = np.einsum('kmi,km->ki', n, c)
+    return np.linalg.solve(ATA, ATb[..., None])[..., 0]
+
+def _greedy_selection(gain, assoc, sizes):
+    """
+    Candidates accepted in order of increasing gain as long as none of
+    their bearings is taken.
+    """
+    taken = [np.zeros(n, dtype=bool) for n in sizes]
+    keep = []
+    for k in np.argsort(gain, kind='stable'):
+        ms = np.flatnonzero(assoc[k] >= 0)
+        if any(taken[m][assoc[k, m]] for m in ms):
+            continue
+        keep.append(k)
+        for m in ms:
+            taken[m][assoc[k, m]] = True
+    return np.array(keep, dtype=int)
+
+def _select_candidates(gain, assoc, sizes):
+    """
+    Indices of the set of candidates with the smallest total gain (only
+    negative gains can help) such that every bearing is used at most once.
+
+    Two arrays: linear_sum_assignment on the L0 x L1 gain matrix. More
+    arrays: the same set packing as a 0/1 integer program (milp). If the
+    solver does not finish within a second, the greedy selection
+    (_greedy_selection) is returned instead.
+    """
+    cand = np.flatnonzero(gain < 0)
+    if len(cand) == 0:
+        return cand
+    gain, assoc = gain[cand], assoc[cand]
+    M = assoc.shape[1]
+    if M == 2:
+        G = np.zeros(sizes)
+        idx = np.full(sizes, -1, dtype=int)
+        G[assoc[:, 0], assoc[:, 1]] = gain
+        idx[assoc[:, 0], assoc[:, 1]] = np.arange(len(cand))
+        rows, cols = linear_sum_assignment(G)
+        keep = idx[rows, cols]
+        return cand[np.sort(keep[keep >= 0])]
+
+    # One row per bearing of every array: sum of the candidates using it <= 1
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    k, m = np.nonzero(assoc >= 0)
+    A = np.zeros((offsets[-1], len(cand)))
+    A[offsets[m] + assoc[k, m], k] = 1.0
+    res = milp(gain, constraints=LinearConstraint(A, ub=1.0), integrality=np.ones(len(cand)),
+               bounds=Bounds(0.0, 1.0), options={"time_limit": 1.0})
+    if res.success:
+        return cand[np.flatnonzero(res.x > 0.5)]
+    return cand[_greedy_selection(gain, assoc, sizes)]
+
+@timed("triangulation")
+def triangulate_sources(centers, doas, room_polygon=None,
+                        max_residual=np.deg2rad(5.0), powers=None,
+                        power_tolerance=np.log(2.0)):
+    """
+    Multi-source triangulation from the bearings of M >= 2 arrays.
+
+    Parameters:
+      centers: (M, 2) array centers
+      doas: list of M 1D arrays with the bearings found by each array
+            (lengths may differ, NaN entries are ignored)
+      room_polygon: optional closed polygon or RoomIndex; intersections
+            further outside it than a bearing error of max_residual can
+            explain are dropped, and the positions are clipped into it
+      max_residual: angular gate (radians) for associating the bearings of
+            the remaining arrays with a candidate intersection
+      powers: optional list of M 1D arrays with the source power behind
+            each bearing (e.g. music_utils.source_powers), aligned with doas
+      power_tolerance: gate on the deviation of the log powers of one
+            candidate from their mean
+
+    The bearing pairs of every pair of arrays are intersected (vectorized
+    per array pair) and intersections behind either array or outside the
+    room are discarded. Each candidate picks up the nearest bearing of every
+    other array within max_residual, is re-estimated by least squares from
+    all of them and scored by the gated squared angular residuals at that
+    position, arrays without a bearing in the gate counting max_residual**2.
+    With powers, a source is expected to reach all arrays with the same
+    power (as in simulate_snapshots), and each gated log-power deviation
+    adds up to another max_residual**2.
+
+    Every bearing left unexplained counts max_residual**2 as well, so a
+    candidate lowers the total cost by its cost minus max_residual**2 per
+    bearing it uses. The set of candidates with the smallest total, each
+    bearing used at most once, is found exactly: linear_sum_assignment on
+    the L0 x L1 crossings for two arrays, a 0/1 integer program (milp) over
+    all candidates otherwise. Should that solver not finish within a
+    second, candidates are accepted greedily instead, cheapest first as
+    long as none of their bearings is taken.
+
+    With two arrays and no powers all pairings cost the same, so the
+    association is arbitrary and some positions are ghosts. Whenever the
+    best selection without one of the accepted sources costs (nearly) as
+    little as the selection itself, a RuntimeWarning reports the ambiguity.
+
+    Returns:
+      positions: (K, 2) estimated source positions
+      assoc: (K, M) index of the bearing used from each array (-1 if none)
+    """
+    rdt = real_dtype()
+    max_residual = rdt(max_residual)
+    centers = np.asarray(centers, dtype=rdt)
+    doas = [np.asarray(d, dtype=rdt).ravel() for d in doas]
+    found = [~np.isnan(d) for d in doas]
+    doas = [d[f] for d, f in zip(doas, found)]
+    M = len(doas)
+    if M < 2:
+        raise ValueError(f"triangulation needs at least 2 arrays, got {M}")
+
+    room = None if room_polygon is None else room_index(room_polygon)
+
+    # Candidates from the bearing pairs of every array pair
+    assoc, points = [], []
+    for a, b in combinations(range(M), 2):
+        p, t, s = intersect_bearing_pairs(centers[a], doas[a], centers[b], doas[b])
+        valid = (t > 0) & (s > 0)
+        if room is not None:
+            # A bearing error within the gate moves the crossing sideways by
+            # up to range * tan(max_residual), so allow that much outside
+            margin = np.nan_to_num(np.minimum(t, s)) * np.tan(max_residual)
+            valid &= room.signed_distance(np.nan_to_num(p)) > -margin
+        i, j = np.nonzero(valid)
+        idx = np.full((len(i), M), -1, dtype=int)
+        idx[:, a], idx[:, b] = i, j
+        assoc.append(idx)
+        points.append(p[i, j])
+    assoc = np.concatenate(assoc)
+    points = np.concatenate(points)
+    if len(assoc) == 0:
+        return np.zeros((0, 2), dtype=rdt), np.zeros((0, M), dtype=int)
+
+    # Nearest bearing of each remaining array within the gate
+    for m in range(M):
+        if len(doas[m]) == 0:
+            continue
+        res = _bearing_residuals(points[:, None], centers[m], doas[m])
+        j = np.argmin(res, axis=-1)
+        hit = (assoc[:, m] < 0) & (res[np.arange(len(j)), j] < max_residual)
+        assoc[hit, m] = j[hit]
+    # Crossings of different array pairs may end up with the same bearings
+    assoc = np.unique(assoc, axis=0)
+    positions = _refine_positions(centers, doas, assoc)
+
+    used = assoc >= 0
+    cost = np.zeros(len(assoc), dtype=rdt)
+    for m in range(M):
+        r = np.full(len(assoc), max_residual, dtype=rdt)
+        k = np.flatnonzero(used[:, m])
+        res = _bearing_residuals(positions[k], centers[m], doas[m][assoc[k, m]])
+        r[k] = np.minimum(res, max_residual)
+        cost += r**2
+    if powers is not None:
+        # Gated deviations of the log powers from their mean per candidate
+        lp = np.zeros(assoc.shape, dtype=rdt)
+        for m, (p, f) in enumerate(zip(powers, found)):
+            p = np.asarray(p, dtype=rdt).ravel()[f]
+            k = np.flatnonzero(used[:, m])
+            lp[k, m] = np.log(np.maximum(p[assoc[k, m]], np.finfo(rdt).tiny))
+        mean = np.sum(lp, axis=-1, keepdims=True) / np.sum(used, axis=-1, keepdims=True)
+        dev = np.minimum(((lp - mean) / rdt(power_tolerance))**2, 1) * used
+        cost += max_residual**2 * np.sum(dev, axis=-1)
+
+    gain = cost - max_residual**2 * np.sum(used, axis=-1)
+    sizes = [len(d) for d in doas]
+    keep = _select_candidates(gain, assoc, sizes)
+    # Ambiguity: without one of the accepted sources, another association
+    # of (nearly) the same total cost exists
+    best = gain[keep].sum()
+    ambiguous = np.zeros(len(keep), dtype=bool)
+    for n, k in enumerate(keep):
+        alt = np.where(np.arange(len(gain)) == k, 0, gain)
+        ambiguous[n] = alt[_select_candidates(alt, assoc, sizes)].sum() <= \
+            best + 0.01 * max_residual**2
+    if np.any(ambiguous):
+        warnings.warn(f"triangulate_sources: {int(ambiguous.sum())} of {len(keep)} sources "
+                      "have an ambiguous bearing association (e.g. only two arrays "
+                      "without distinct source powers); their positions may be ghosts",
+                      RuntimeWarning, stacklevel=3)
+    positions = positions[keep]
+    if room is not None:
+        positions = room.clip(positions).astype(rdt)
+    return positions, assoc[keep]
@@ -0,0 +1,253 @@
+"""
+Lightweight per-stage timing for the localization pipeline.
+
+Hot-path functions are wrapped with @timed("<stage>") (or a
+`with stage("<stage>"):` block). While instrumentation is disabled the
+wrapper only checks a module flag and calls straight through.
+
+Stages used across the code base:
+  covariance, eigendecomposition, spectrum, find_peaks, triangulation, filter
+
+Stages nest (localize_direct, a triangulation, calls position_spectrum, a
+spectrum); each call's self time excludes the stages timed inside it, so
+the self times of all stages add up to the instrumented wall time. Memory
+stays bounded: per stage only running totals and a uniform reservoir of at
+most max_samples durations (for the percentiles) are kept.
+
+Enable from code with enable(), or from the environment:
+  SSM_PROFILE=1             collect timings
+  SSM_PROFILE_TRACE=path    also write a Chrome/Perfetto trace file at exit
+"""
+import atexit
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+_enabled = False
+_tracing = False
+_max_trace_events = 1_000_000
+_max_samples = 10_000
+
+_lock = threading.Lock()
+_stats = {}                         # stage -> _StageStats
+_trace_events = []                  # (stage, start [s], duration [s], pid, tid)
+_t0 = time.perf_counter()
+_reservoir_rng = random.Random(0)
+_local = threading.local()          # per-thread stack of child time of open calls
+
+class _StageStats:
+    """
+    Running count, total, self-time total and max of one stage, plus a
+    uniform reservoir sample of its call durations (algorithm R).
+    """
+    __slots__ = ("count", "total", "self_total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.self_total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, duration, self_time):
+        self.count += 1
+        self.total += duration
+        self.self_total += self_time
+        self.max = max(self.max, duration)
+        if len(self.samples) < _max_samples:
+            self.samples.append(duration)
+        else:
+            j = _reservoir_rng.randrange(self.count)
+            if j < _max_samples:
+                self.samples[j] = duration
+
+def enable(trace=False, max_trace_events=1_000_000, max_samples=10_000):
+    """
+    Start collecting stage timings. With trace=True every call is also kept
+    as a trace event (up to max_trace_events) for dump_trace(). Percentiles
+    and histograms use up to max_samples durations per stage (exact below
+    that many calls).
+    """
+    global _enabled, _tracing, _max_trace_events, _max_samples
+    _tracing = trace
+    _max_trace_events = max_trace_events
+    _max_samples = max_samples
+    _enabled = True
+
+def disable():
+    """
+    Stop collecting; already recorded timings are kept.
+    """
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """
+    Drop all recorded timings and trace events.
+    """
+    with _lock:
+        _stats.clear()
+        _trace_events.clear()
+
+def _open():
+    """
+    Push a child-time accumulator for a call that is starting.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+
+def _record(name, start, end):
+    """
+    Close the innermost open call: charge its duration to the enclosing
+    call's children and record it with its self time.
+    """
+    stack = _local.stack
+    duration = end - start
+    children = stack.pop()
+    if stack:
+        stack[-1] += duration
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = _StageStats()
+        stats.add(duration, duration - children)
+        if _tracing and len(_trace_events) < _max_trace_events:
+            _trace_events.append((name, start - _t0, duration,
+                                  os.getpid(), threading.get_ident()))
+
+def timed(name):
+    """
+    Decorator recording the wall time of every call under stage `name`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            _open()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _open()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.start, time.perf_counter())
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def stage(name):
+    """
+    Context manager timing a block under stage `name`.
+    """
+    return _Span(name) if _enabled else _NULL_SPAN
+
+def summary():
+    """
+    Per-stage statistics: count, total and self time [ms] (self excludes
+    nested stages), mean/max [us] over all calls and p50/p90/p99 [us] over
+    the reservoir sample.
+    """
+    with _lock:
+        data = {k: (v.count, v.total, v.self_total, v.max, np.array(v.samples))
+                for k, v in _stats.items() if v.count}
+    out = {}
+    for name, (count, total, self_total, longest, d) in sorted(data.items()):
+        p50, p90, p99 = np.percentile(d * 1e6, [50, 90, 99])
+        out[name] = {"count": count, "total_ms": total * 1e3, "self_ms": self_total * 1e3,
+                     "mean_us": total / count * 1e6, "p50_us": float(p50),
+                     "p90_us": float(p90), "p99_us": float(p99),
+                     "max_us": longest * 1e6}
+    return out
+
+def histogram(name, bins=20):
+    """
+    Histogram of the sampled call durations of one stage (all calls up to
+    max_samples) on log-spaced bins.
+    Returns (counts, bin_edges_us).
+    """
+    with _lock:
+        stats = _stats.get(name)
+        us = np.array(stats.samples if stats else []) * 1e6
+    if len(us) == 0:
+        return np.zeros(bins, dtype=int), np.zeros(bins + 1)
+    lo, hi = max(us.min(), 1e-3), max(us.max(), 1e-3)
+    edges = np.logspace(np.log10(lo), np.log10(hi * 1.0001), bins + 1)
+    counts, _ = np.histogram(us, bins=edges)
+    return counts, edges
+
+def report():
+    """
+    Plain-text table of summary(); share is each stage's part of the summed
+    self times.
+    """
+    stats = summary()
+    if not stats:
+        return "no stage timings recorded"
+    wall = sum(s["self_ms"] for s in stats.values()) or 1.0
+    head = f"{'stage':<20} {'count':>8} {'total[ms]':>11} {'self[ms]':>10} {'share':>6} " \
+           f"{'mean[us]':>10} {'p50[us]':>10} {'p99[us]':>10} {'max[us]':>10}"
+    lines = [head, "-" * len(head)]
+    for name, s in stats.items():
+        lines.append(f"{name:<20} {s['count']:>8d} {s['total_ms']:>11.3f} "
+                     f"{s['self_ms']:>10.3f} {s['self_ms'] / wall:>6.1%} "
+                     f"{s['mean_us']:>10.1f} {s['p50_us']:>10.1f} "
+                     f"{s['p99_us']:>10.1f} {s['max_us']:>10.1f}")
+    return "\n".join(lines)
+
+def dump_trace(path):
+    """
+    Write recorded trace events (Chrome trace-event JSON, viewable in
+    chrome://tracing or Perfetto) together with the per-stage summary.
+    """
+    with _lock:
+        events = list(_trace_events)
+    trace = {
+        "traceEvents": [{"name": name, "cat": "stage", "ph": "X",
+                         "ts": start * 1e6, "dur": dur * 1e6,
+                         "pid": pid, "tid": tid}
+                        for name, start, dur, pid, tid in events],
+        "displayTimeUnit": "ms",
+        "summary": summary(),
+    }
+    with open(path, "w") as f:
+        json.dump(trace, f)
+
+if os.environ.get("SSM_PROFILE", "") not in ("", "0"):
+    _trace_path = os.environ.get("SSM_PROFILE_TRACE")
+    enable(trace=bool(_trace_path))
+    if _trace_path:
+        atexit.register(dump_trace, _trace_path)
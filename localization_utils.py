@@ -0,0 +1,200 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.ndimage import maximum_filter
+
+from array_utils import _steering_vectors, DEFAULT_WAVENUMBER, real_dtype, complex_dtype, get_precision
+from geometry_utils import RoomIndex, contains_points, points_in_polygon
+from instrumentation import timed
+
+# Direct position-domain localization: instead of estimating one bearing
+# per array and intersecting them, a joint cost of all arrays is scanned
+# over (x, y) positions in the room, so no bearing association is needed.
+# Each array is treated in the far field: a candidate position p is seen
+# from array m under the bearing atan2(p - c_m), as in simulate_snapshots.
+
+@lru_cache(maxsize=8)
+def _room_grid(poly_bytes, shape, spacing):
+    """
+    Cached raster over the polygon's bounding box: cell-center coordinates
+    (xs, ys) and the (ny x nx) mask of cells inside the polygon.
+    """
+    poly = np.frombuffer(poly_bytes).reshape(shape)
+    lo, hi = poly.min(axis=0), poly.max(axis=0)
+    xs = np.arange(lo[0] + spacing / 2, hi[0], spacing)
+    ys = np.arange(lo[1] + spacing / 2, hi[1], spacing)
+    X, Y = np.meshgrid(xs, ys)
+    mask = points_in_polygon(np.stack([X, Y], axis=-1), poly)
+    for a in (xs, ys, mask):
+        a.setflags(write=False)
+    return xs, ys, mask
+
+def room_grid(room_polygon, spacing):
+    """
+    Raster of the room at the given cell spacing (cached per polygon and
+    spacing). Returns (xs, ys, mask) with mask[i, j] True when the point
+    (xs[j], ys[i]) lies inside room_polygon. The arrays are read-only.
+    """
+    if isinstance(room_polygon, RoomIndex):
+        room_polygon = room_polygon.polygon
+    poly = np.ascontiguousarray(room_polygon, dtype=float)
+    return _room_grid(poly.tobytes(), poly.shape, float(spacing))
+
+def _position_steering(arrays, centers, points, wavenumber):
+    """
+    Steering tensor (M, N, P) of every array towards every point (P, 2).
+    """
+    thetas = np.arctan2(points[None, :, 1] - centers[:, None, 1],
+                        points[None, :, 0] - centers[:, None, 0])
+    return _steering_vectors(arrays, thetas, wavenumber)
+
+@lru_cache(maxsize=8)
+def _grid_steering(arrays_bytes, arrays_shape, centers_bytes, poly_bytes, poly_shape,
+                   spacing, wavenumber_bytes, wavenumber_shape, precision):
+    """
+    Cached steering tensor ([F,] M, N, P) over the inside cells of room_grid,
+    in the given precision (the current one when built).
+    """
+    arrays = np.frombuffer(arrays_bytes).reshape(arrays_shape)
+    centers = np.frombuffer(centers_bytes).reshape(-1, 2)
+    wavenumber = np.frombuffer(wavenumber_bytes).reshape(wavenumber_shape)
+    xs, ys, mask = _room_grid(poly_bytes, poly_shape, spacing)
+    X, Y = np.meshgrid(xs, ys)
+    points = np.stack([X[mask], Y[mask]], axis=-1)
+    A = _position_steering(arrays, centers, points, wavenumber)
+    A.setflags(write=False)
+    return A
+
+def _array_projectors(CovMats, L, method):
+    """
+    Per-array matrices W (M, N, K) such that the cost of a steering vector a
+    is ||W^H a||^2: the L signal eigenvectors for "music", the Cholesky-like
+    factor R = W W^H (normalized by the trace) for "srp".
+    """
+    w, V = np.linalg.eigh(np.asarray(CovMats, dtype=complex_dtype()))   # ascending
+    N = V.shape[-1]
+    if method == "music":
+        return V[..., N - L:]
+    if method == "srp":
+        w = np.maximum(w, 0.0) / np.sum(w, axis=-1, keepdims=True)
+        return V * np.sqrt(w)[..., None, :]
+    raise ValueError(f"unknown method {method!r}, expected 'music' or 'srp'")
+
+def _joint_cost(W, A):
+    """
+    Joint cost of steering tensors A ([F,] M, N, ...) for projectors
+    W ([F,] M, N, K), averaged over the arrays (and frequency bins).
+    """
+    lead, N = W.shape[:-2], W.shape[-2]
+    P = np.abs(np.swapaxes(W, -1, -2).conj() @ A.reshape(lead + (N, -1)))**2
+    gain = np.sum(P, axis=-2).reshape(-1, P.shape[-1]).mean(axis=0)
+    return gain.reshape(A.shape[len(lead) + 1:])
+
+@timed("spectrum")
+def position_spectrum(CovMats, L, arrays, centers, room_polygon, spacing=0.5,
+                      method="music", wavenumber=DEFAULT_WAVENUMBER, projectors=None):
+    """
+    Joint pseudospectrum of all arrays over the room raster.
+
+    For "music" the value at position p is 1 / (1 - g(p)) where g is the
+    mean over arrays of ||Qs^H a_m(p)||^2, the energy of the steering vector
+    in the signal subspace (so 1 - g is the mean MUSIC denominator
+    ||P_n a||^2). For "srp", it is the mean normalized steered response
+    power a^H R a / tr(R).
+
+    Parameters:
+      CovMats: M x N x N covariance matrices, one per array, or F x M x N x N
+               with a (F,) wavenumber (one per frequency bin); the cost is
+               then also averaged over the bins (incoherent wideband)
+      L: number of sources
+      arrays: M x N x 2 element positions
+      centers: M x 2 array centers
+      room_polygon: closed room polygon or RoomIndex
+      spacing: raster cell size
+      method: "music" or "srp"
+      wavenumber: steering wavenumber, or a (F,) array of them
+      projectors: the per-array eigenvector factors of CovMats for method,
+                  if already computed (localize_direct reuses them for its
+                  fine stage); CovMats is then not decomposed again
+
+    Returns (xs, ys, spectrum) with spectrum of shape (len(ys), len(xs)),
+    NaN outside the room.
+    """
+    if isinstance(room_polygon, RoomIndex):
+        room_polygon = room_polygon.polygon
+    arrays = np.ascontiguousarray(arrays, dtype=float)
+    centers = np.ascontiguousarray(centers, dtype=float)
+    poly = np.ascontiguousarray(room_polygon, dtype=float)
+    xs, ys, mask = _room_grid(poly.tobytes(), poly.shape, float(spacing))
+    wavenumber = np.array(wavenumber, dtype=float)
+    A = _grid_steering(arrays.tobytes(), arrays.shape, centers.tobytes(),
+                       poly.tobytes(), poly.shape, float(spacing), wavenumber.tobytes(),
+                       wavenumber.shape, get_precision())
+
+    if projectors is None:
+        projectors = _array_projectors(np.asarray(CovMats), L, method)
+    gain = _joint_cost(projectors, A)
+    if method == "music":
+        gain = 1.0 / np.maximum(1.0 - gain, np.finfo(gain.dtype).eps)
+    spectrum = np.full(mask.shape, np.nan, dtype=gain.dtype)
+    spectrum[mask] = gain
+    return xs, ys, spectrum
+
+@timed("triangulation")
+def localize_direct(CovMats, L, arrays, centers, room_polygon, spacing=0.5,
+                    resolution=0.01, method="music", wavenumber=DEFAULT_WAVENUMBER,
+                    num_points=9):
+    """
+    Direct position estimate of L sources from the covariance matrices of
+    all arrays, without bearing association.
+
+    The joint cost (see position_spectrum) is scanned on a cached coarse
+    raster of the room; the L highest local maxima are then refined on
+    local num_points x num_points grids, shrunk around the best cell until
+    the spacing falls below resolution. A 30 m x 30 m room at spacing=0.5
+    reaches 1 cm with a few hundred extra evaluations per source instead of
+    a 3000 x 3000 global grid. CovMats and wavenumber are as in
+    position_spectrum (F x M x N x N with F wavenumbers for wideband data).
+
+    Returns:
+      positions: (K x 2) estimates, K <= L, ordered by decreasing cost
+      scores: (K,) joint cost at each estimate
+    """
+    rdt = real_dtype()
+    arrays = np.asarray(arrays, dtype=rdt)
+    centers = np.asarray(centers, dtype=rdt)
+    # One eigendecomposition per array for both the coarse and fine stages
+    W = _array_projectors(np.asarray(CovMats), L, method)
+    xs, ys, spectrum = position_spectrum(CovMats, L, arrays, centers, room_polygon,
+                                         spacing, method, wavenumber, projectors=W)
+
+    # L highest local maxima of the coarse map (outside cells never win)
+    filled = np.where(np.isnan(spectrum), -np.inf, spectrum)
+    peaks = (filled == maximum_filter(filled, size=3, mode="constant", cval=-np.inf))
+    peaks &= np.isfinite(filled)
+    iy, ix = np.nonzero(peaks)
+    best = np.argsort(filled[iy, ix])[::-1][:L]
+    centers_xy = np.stack([xs[ix[best]], ys[iy[best]]], axis=-1).astype(rdt)
+    if len(centers_xy) == 0:
+        return np.zeros((0, 2), dtype=rdt), np.zeros(0, dtype=rdt)
+
+    offsets = np.linspace(-1.0, 1.0, num_points, dtype=rdt)
+    dx, dy = np.meshgrid(offsets, offsets)
+    local = np.stack([dx.ravel(), dy.ravel()], axis=-1)          # (Q, 2)
+    half_width = rdt(spacing)
+    while True:
+        cand = centers_xy[:, None, :] + half_width * local       # (K, Q, 2)
+        A = _position_steering(arrays, centers, cand.reshape(-1, 2), wavenumber)
+        gain = _joint_cost(W, A).reshape(cand.shape[:2])
+        gain = np.where(contains_points(room_polygon, cand), gain, -np.inf)
+        k = np.argmax(gain, axis=1)
+        centers_xy = cand[np.arange(len(cand)), k]
+        scores = gain[np.arange(len(cand)), k]
+        half_width = 2.0 * half_width / (num_points - 1)
+        if half_width < resolution:
+            break
+
+    if method == "music":
+        scores = 1.0 / np.maximum(1.0 - scores, np.finfo(rdt).eps)
+    order = np.argsort(scores)[::-1]
+    return centers_xy[order], scores[order]
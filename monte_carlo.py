@@ -0,0 +1,174 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import instrumentation
+from geometry_utils import generate_random_points_in_polygon
+from pipeline import (ROOM_POLYGON, ARRAY_CENTERS, run_intersection, run_direct, run_kf,
+                      run_ekf)
+
+PIPELINES = ("intersection", "direct", "kf", "ekf")
+STAGES = ("covariance", "eigendecomposition", "spectrum", "find_peaks",
+          "triangulation", "filter")
+
+def run_trial(pipeline, params, seed):
+    """
+    Run one randomized trial of a pipeline.
+
+    Parameters:
+      pipeline: "intersection", "direct", "kf" or "ekf"
+      params: dict with snr, num_snapshot, num_arrays, grid_size,
+              N, array_radius, num_steps (grid_size and num_steps are
+              ignored where they do not apply)
+      seed: numpy.random.SeedSequence for this trial; every random draw of
+            the trial comes from it, so the result does not depend on which
+            worker runs it
+
+    Returns a dict with the position error (NaN if no estimate) and the
+    wall time spent in each stage, as recorded by instrumentation (which is
+    reset for every trial); nested stages are not counted twice.
+    """
+    rng = np.random.default_rng(seed)
+    centers = ARRAY_CENTERS[:params["num_arrays"]]
+    src = generate_random_points_in_polygon(ROOM_POLYGON, 1, rng)[0]
+    common = {"snr": params["snr"], "num_snapshot": params["num_snapshot"],
+              "N": params["N"], "array_radius": params["array_radius"],
+              "grid_size": params["grid_size"], "rng": rng}
+
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        if pipeline == "intersection":
+            estimates = run_intersection(src[None], centers, **common)["estimates"]
+            estimate = estimates[0] if len(estimates) else np.full(2, np.nan)
+        elif pipeline == "direct":
+            common.pop("grid_size")
+            estimates = run_direct(src[None], centers, **common)["estimates"]
+            estimate = estimates[0] if len(estimates) else np.full(2, np.nan)
+        elif pipeline == "kf":
+            estimate = run_kf(src, centers, num_steps=params["num_steps"], **common)["track"][-1]
+        elif pipeline == "ekf":
+            estimate = run_ekf(src, centers, num_steps=params["num_steps"], **common)["track"][-1]
+        else:
+            raise ValueError(f"unknown pipeline {pipeline!r}, expected one of {PIPELINES}")
+    finally:
+        instrumentation.disable()
+
+    timings = {name: s["self_ms"] / 1e3 for name, s in instrumentation.summary().items()}
+    error = float(np.linalg.norm(estimate - src))
+    return {"error": error, "timings": timings}
+
+def _run_task(task):
+    pipeline, params, seed = task
+    return run_trial(pipeline, params, seed)
+
+def sweep(pipelines=PIPELINES, snrs=(5.0,), snapshots=(200,), array_counts=(3,),
+          grid_sizes=(360,), num_trials=100, seed=0, workers=None,
+          N=16, array_radius=1.0, num_steps=20, fail_threshold=1.0):
+    """
+    Monte Carlo sweep over pipelines x SNR x snapshot count x array count x
+    grid size.
+
+    Trials are fanned out over a process pool of `workers` processes
+    (os.cpu_count() by default; 1 runs in-process and resets the global
+    instrumentation state). Each trial gets its own
+    child of SeedSequence(seed), spawned per configuration and trial, so the
+    results are bit-identical whatever the worker count.
+
+    A trial fails when it produces no estimate or misses the source by more
+    than fail_threshold meters; RMSE is computed over successful trials.
+    Returns a list of one summary dict per configuration.
+    """
+    configs = []
+    for pipeline, snr, T, M, G in itertools.product(pipelines, snrs, snapshots,
+                                                    array_counts, grid_sizes):
+        if M < 2 or M > len(ARRAY_CENTERS):
+            raise ValueError(f"array count must be between 2 and {len(ARRAY_CENTERS)}")
+        configs.append((pipeline, {"snr": float(snr), "num_snapshot": int(T),
+                                   "num_arrays": int(M), "grid_size": int(G),
+                                   "N": N, "array_radius": array_radius,
+                                   "num_steps": num_steps}))
+
+    config_seeds = np.random.SeedSequence(seed).spawn(len(configs))
+    tasks = [(pipeline, params, trial_seed)
+             for (pipeline, params), cs in zip(configs, config_seeds)
+             for trial_seed in cs.spawn(num_trials)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [_run_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_task, tasks,
+                                    chunksize=max(1, len(tasks) // (4 * workers))))
+
+    summaries = []
+    for c, (pipeline, params) in enumerate(configs):
+        trials = results[c * num_trials:(c + 1) * num_trials]
+        errors = np.array([r["error"] for r in trials])
+        failed = ~(errors <= fail_threshold)
+        ok = errors[~failed]
+        summary = {"pipeline": pipeline, **params,
+                   "num_trials": num_trials,
+                   "rmse": float(np.sqrt(np.mean(ok**2))) if len(ok) else float("nan"),
+                   "failure_rate": float(np.mean(failed))}
+        for stage in STAGES:
+            summary[f"{stage}_ms"] = 1e3 * float(np.mean(
+                [r["timings"].get(stage, 0.0) for r in trials]))
+        summaries.append(summary)
+    return summaries
+
+def format_table(summaries):
+    """
+    Render sweep summaries as a plain-text table.
+    """
+    cols = ["pipeline", "snr", "num_snapshot", "num_arrays", "grid_size",
+            "rmse", "failure_rate"] + [f"{s}_ms" for s in STAGES]
+    heads = ["pipeline", "snr", "T", "M", "G", "rmse[m]", "fail"] + \
+            [f"{s[:5]}[ms]" for s in STAGES]
+    rows = []
+    for s in summaries:
+        row = []
+        for col in cols:
+            v = s[col]
+            row.append(f"{v:.4g}" if isinstance(v, float) else str(v))
+        rows.append(row)
+    widths = [max(len(h), *(len(r[i]) for r in rows)) for i, h in enumerate(heads)]
+    lines = ["  ".join(h.rjust(w) for h, w in zip(heads, widths)),
+             "  ".join("-" * w for w in widths)]
+    lines += ["  ".join(v.rjust(w) for v, w in zip(r, widths)) for r in rows]
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo localization accuracy sweep")
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES), choices=PIPELINES)
+    parser.add_argument("--snr", nargs="+", type=float, default=[5.0])
+    parser.add_argument("--snapshots", nargs="+", type=int, default=[200])
+    parser.add_argument("--arrays", nargs="+", type=int, default=[3])
+    parser.add_argument("--grid", nargs="+", type=int, default=[360])
+    parser.add_argument("--trials", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=20, help="frames per KF/EKF trial")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="monte_carlo_results.json")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summaries = sweep(args.pipelines, args.snr, args.snapshots, args.arrays, args.grid,
+                      num_trials=args.trials, seed=args.seed, workers=args.workers,
+                      num_steps=args.steps)
+    elapsed = time.perf_counter() - start
+
+    print(format_table(summaries))
+    print(f"\n{len(summaries) * args.trials} trials in {elapsed:.1f} s")
+    with open(args.out, "w") as f:
+        json.dump({"seed": args.seed, "results": summaries}, f, indent=2)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,29 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import scipy.linalg as LA
-import scipy.signal as ss
-from array_utils import array_response_vector_circular
 
-def music(CovMat, L, N, array_2D, Angles):
+from instrumentation import stage
+from array_utils import (
+    music_spectrum,
+    subspace_decomposition,
+    simulate_covmats,
+    top_peaks,
+    refine_music_peaks,
+    steering_matrix_circular,
+    _grid_step,
+    _refine_peaks,
+    _steering_vectors,
+    DEFAULT_WAVENUMBER,
+    SPEED_OF_SOUND,
+    complex_dtype,
+    real_dtype,
+    wavenumber,
+)
+
+def music(CovMat, L, N, array_2D, Angles, wavenumber=DEFAULT_WAVENUMBER):
     """
     Compute the MUSIC pseudospectrum for a given covariance matrix.
     
@@ -13,54 +33,238 @@ def music(CovMat, L, N, array_2D, Angles):
       N: number of elements in the array
       array_2D: positions of array elements
       Angles: array of angles to be scanned
+      wavenumber: steering wavenumber, e.g. array_utils.wavenumber(freq)
     
     Returns:
-      peaks: indices of found peaks
+      peaks: indices of the (up to) L most prominent peaks in dB, strongest
+             first; peaks straddling ±pi are found on full-circle grids
       pspectrum: pseudospectrum values at each angle
     """
-    # Eigenvalue decomposition
-    _, V = LA.eig(CovMat)
-    Qn = V[:, L:N]  # Noise subspace 
+    # Hermitian eigendecomposition (only the smaller subspace is computed)
+    Qn = subspace_decomposition(CovMat, L)
     
-    pspectrum = np.zeros_like(Angles, dtype=float)
-    for i, angle in enumerate(Angles):
-        av = array_response_vector_circular(array_2D, angle)
-        pspectrum[i] = 1.0 / LA.norm(Qn.conj().T @ av)
+    pspectrum = music_spectrum(Qn, array_2D, Angles, wavenumber)
     
-    # convert to dB scale
-    psindB = np.log10(10 * pspectrum / pspectrum.min())
-    # find peaks
-    peaks, _ = ss.find_peaks(psindB, distance=1.5, height=1.35)
-    
-    return peaks, pspectrum
+    peaks = top_peaks(pspectrum, Angles, L, log=True).indices
+    return peaks[peaks >= 0], pspectrum
 
-def get_music_peaks(CovMat, L, N, array_2D, Angles):
+def get_music_peaks(CovMat, L, N, array_2D, Angles, refine=False,
+                    wavenumber=DEFAULT_WAVENUMBER):
     """
     A convenience function to extract the sorted DOA peaks from the MUSIC algorithm.
+
+    The L most prominent peaks (see music) are returned sorted by angle.
+    With refine=True, Angles is used as a coarse grid and these peaks are
+    refined off-grid with refine_music_peaks, which reaches sub-0.1°
+    accuracy with far fewer spectrum evaluations than a dense grid.
+    """
+    if not refine:
+        pidx, pspectrum = music(CovMat, L, N, array_2D, Angles, wavenumber)
+        order = np.argsort(Angles[pidx])
+        return Angles[pidx[order]], pidx[order], pspectrum
+
+    Qn = subspace_decomposition(CovMat, L)
+    pspectrum = music_spectrum(Qn, array_2D, Angles, wavenumber)
+    pidx = top_peaks(pspectrum, Angles, L, log=True).indices
+    pidx = pidx[pidx >= 0]
+    doa_refined = refine_music_peaks(Qn, array_2D, Angles[pidx], _grid_step(Angles),
+                                     wavenumber=wavenumber)
+    order = np.argsort(doa_refined)
+    return doa_refined[order], pidx[order], pspectrum
+
+def music_batch(CovMats, L, arrays, Angles):
+    """
+    MUSIC pseudospectra of M arrays in batched NumPy operations.
+
+    Parameters:
+      CovMats: M x N x N stack of covariance matrices
+      L: number of sources
+      arrays: M x N x 2 stack of array element positions
+      Angles: array of angles to be scanned (shared by all arrays)
+
+    Returns:
+      eigvals: M x N eigenvalues of each covariance, in descending order
+      pspectra: M x G pseudospectra
+    """
+    CovMats = np.asarray(CovMats, dtype=complex_dtype())
+    # Stacked Hermitian eigendecomposition (ascending eigenvalues)
+    with stage("eigendecomposition"):
+        w, V = np.linalg.eigh(CovMats)
+
+    with stage("spectrum"):
+        norms = _batch_noise_norms(V, L, steering_matrix_circular(arrays, Angles))
+    return w[..., ::-1], 1.0 / norms
+
+def _batch_noise_norms(V, L, A):
+    """
+    || P_n a || for stacked eigenvectors V (M, N, N) and steering A (M, N, G).
+    """
+    N = V.shape[-1]
+    if L <= N - L:
+        # ||P_n a||^2 = ||a||^2 - ||Qs^H a||^2 with the L signal vectors
+        QsH = np.swapaxes(V[..., N - L:], -1, -2).conj()
+        sq = (np.sum(np.abs(A)**2, axis=-2) -
+              np.sum(np.abs(QsH @ A)**2, axis=-2))
+        norms = np.sqrt(np.maximum(sq, np.finfo(sq.dtype).tiny))
+    else:
+        QnH = np.swapaxes(V[..., :N - L], -1, -2).conj()
+        norms = LA.norm(QnH @ A, axis=-2)
+    return norms
+
+def get_music_peaks_batch(CovMats, L, arrays, Angles):
+    """
+    Batched counterpart of get_music_peaks for M arrays at once.
+
+    Returns:
+      doas: M x L DoA estimates sorted by angle (NaN where fewer peaks exist)
+      pidx: M x L peak indices matching doas (-1 where missing)
+      pspectra: M x G pseudospectra
+    """
+    _, pspectra = music_batch(CovMats, L, arrays, Angles)
+    pidx, doas, _, _ = top_peaks(pspectra, Angles, L, log=True)
+    # sort by angle (NaN last), keeping the indices aligned
+    order = np.argsort(doas, axis=-1)
+    doas = np.take_along_axis(doas, order, axis=-1).astype(real_dtype(), copy=False)
+    pidx = np.take_along_axis(pidx, order, axis=-1)
+    return doas, pidx, pspectra
+
+def source_powers(CovMats, doas, arrays, wavenumber=DEFAULT_WAVENUMBER):
+    """
+    Least-squares powers of the sources behind the DoAs of M arrays.
+
+    With A the steering vectors of the L DoAs found by an array and sigma^2
+    the mean of its N - L smallest eigenvalues, the source covariance is
+    A^+ (R - sigma^2 I) A^+H. Its diagonal is returned as an M x L array
+    (NaN where doas is NaN), on the scale of CovMats; only ratios between
+    arrays measured with the same number of snapshots are meaningful.
+    triangulate_sources uses them to pair the bearings of different arrays.
     """
-    pidx, pspectrum = music(CovMat, L, N, array_2D, Angles)
-    doa_candidates = Angles[pidx]
-    # sort and pick the first L peaks
-    doa_sorted = np.sort(doa_candidates)[:L]
-    return doa_sorted, pidx, pspectrum
+    CovMats = np.asarray(CovMats, dtype=complex_dtype())
+    doas = np.asarray(doas)
+    M, N = CovMats.shape[:2]
+    powers = np.full(doas.shape, np.nan, dtype=CovMats.real.dtype)
+    for m in range(M):
+        found = ~np.isnan(doas[m])
+        L = int(found.sum())
+        if L == 0:
+            continue
+        w = LA.eigvalsh(CovMats[m])
+        A = _steering_vectors(arrays[m], doas[m][found], wavenumber)
+        Ap = LA.pinv(A)
+        S = Ap @ (CovMats[m] - w[:N - L].mean() * np.eye(N)) @ Ap.conj().T
+        powers[m, found] = np.maximum(np.diag(S).real, 0)
+    return powers
 
-def measure_covmat(array_2D, theta_source, alpha_source, snr, num_snapshot=200):
+# -------------------------------------------------------------
+# Wideband (incoherent) MUSIC over STFT frequency bins
+# -------------------------------------------------------------
+
+_wideband_pools = {}
+_wideband_pool_lock = threading.Lock()
+
+def _get_wideband_pool(workers=None):
+    # Shared thread pools, one per worker count, created on first use;
+    # LAPACK/BLAS calls release the GIL, so bin groups run concurrently.
+    workers = workers or os.cpu_count() or 1
+    with _wideband_pool_lock:
+        pool = _wideband_pools.get(workers)
+        if pool is None:
+            pool = _wideband_pools[workers] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="wideband-music")
+        return pool
+
+def _wideband_group(CovMats, L, A):
+    """
+    Normalized pseudospectra of one group of bins, summed over the group.
+    A is the (F, N, G) slice of the wideband steering tensor for these bins.
+    Also returns the eigenvectors and normalization of each bin so the
+    combined spectrum can be re-evaluated off-grid.
+    """
+    with stage("eigendecomposition"):
+        _, V = np.linalg.eigh(CovMats)                      # (F, N, N), ascending
+    with stage("spectrum"):
+        ps = 1.0 / _batch_noise_norms(V, L, A)              # (F, G)
+        scale = 1.0 / ps.max(axis=-1)
+        return V, scale, scale @ ps
+
+def wideband_music(CovMats, L, array_2D, Angles, freqs, c=SPEED_OF_SOUND,
+                   workers=None, bins_per_task=8):
+    """
+    Incoherent wideband MUSIC: the narrowband pseudospectra of all frequency
+    bins, each normalized to a unit maximum, averaged into one DoA spectrum.
+
+    The (F, N, G) steering tensor of all bins is one steering-cache entry,
+    so it is built once per (array, Angles, freqs) and reused across
+    frames. Bins are processed in groups of bins_per_task with stacked eigh
+    and steering-matrix products; the groups are spread over a shared pool
+    of workers threads (all CPUs by default; workers=1 runs them in the
+    calling thread).
+
+    Parameters:
+      CovMats: F x N x N per-bin covariance matrices (audio_utils.stft_covariances)
+      L: number of sources
+      array_2D: (N x 2) element positions in meters
+      Angles: array of angles to be scanned
+      freqs: (F,) bin frequencies [Hz]
+      c: speed of sound [m/s]
+
+    Returns:
+      pspectrum: combined pseudospectrum over Angles
+      bins: (V, scale, ks) per-bin eigenvectors, normalizations and
+            wavenumbers, used by get_wideband_music_peaks for refinement
+    """
+    CovMats = np.asarray(CovMats, dtype=complex_dtype())
+    ks = wavenumber(freqs, c)
+    with stage("spectrum"):
+        A = steering_matrix_circular(array_2D, Angles, ks)  # (F, N, G)
+    groups = [slice(i, i + bins_per_task) for i in range(0, len(ks), bins_per_task)]
+    tasks = [(CovMats[g], L, A[g]) for g in groups]
+
+    if workers == 1 or len(tasks) == 1:
+        results = [_wideband_group(*t) for t in tasks]
+    else:
+        pool = _get_wideband_pool(workers)
+        results = list(pool.map(lambda t: _wideband_group(*t), tasks))
+
+    # summed in group order, so the result does not depend on the scheduling
+    pspectrum = sum(r[2] for r in results) / len(ks)
+    V = np.concatenate([r[0] for r in results])
+    scale = np.concatenate([r[1] for r in results])
+    return pspectrum, (V, scale, ks)
+
+def get_wideband_music_peaks(CovMats, L, N, array_2D, Angles, freqs, refine=False,
+                             c=SPEED_OF_SOUND, workers=None):
+    """
+    Wideband counterpart of get_music_peaks: same arguments plus the bin
+    frequencies, same (doa_sorted, pidx, pspectrum) return values, with
+    pspectrum the combined spectrum of wideband_music.
+
+    With refine=True the L most prominent peaks are refined off-grid on the
+    combined spectrum, as in get_music_peaks.
+    """
+    pspectrum, (V, scale, ks) = wideband_music(CovMats, L, array_2D, Angles, freqs,
+                                               c, workers)
+    pidx = top_peaks(pspectrum, Angles, L, log=True).indices
+    pidx = pidx[pidx >= 0]
+    if not refine:
+        order = np.argsort(pidx)
+        return Angles[pidx[order]], pidx[order], pspectrum
+
+    def spectrum(grid):
+        A = _steering_vectors(array_2D, grid, ks)                       # (F, P, N, K)
+        ps = 1.0 / _batch_noise_norms(V[:, None], L, A)                 # (F, P, K)
+        return np.tensordot(scale, ps, axes=1)
+
+    with stage("spectrum"):
+        doa_refined = _refine_peaks(spectrum, Angles[pidx], _grid_step(Angles))
+    order = np.argsort(doa_refined)
+    return doa_refined[order], pidx[order], pspectrum
+
+def measure_covmat(array_2D, theta_source, alpha_source, snr, num_snapshot=200, rng=None):
     """
     It produces a covariance matrix by adding Gaussian noise (num_snapshot count) to a 
     signal measured from a single source at a given angle and amplitude.
     """
-    N = array_2D.shape[0]
-    H = np.zeros((N, num_snapshot), dtype=complex)
-    
-    for it in range(num_snapshot):
-        # Rastgele bir faz
-        pha = np.exp(1j * 2*np.pi * np.random.rand())
-        # Kaynak sinyali
-        htmp = pha * alpha_source * array_response_vector_circular(array_2D, theta_source)
-        # Gauss gürültü ekle
-        noise_scale = np.sqrt(0.5 / snr)
-        htmp += noise_scale * (np.random.randn(N) + 1j*np.random.randn(N))
-        H[:, it] = htmp
-    
-    CovMat = H @ H.conj().T
+    CovMat = simulate_covmats(array_2D, [theta_source], [alpha_source], snr,
+                              num_snapshot, num_trials=1, rng=rng)[0]
     return CovMat
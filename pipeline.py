@@ -0,0 +1,321 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from geometry_utils import generate_random_points_in_polygon, triangulate_sources, room_index
+from array_utils import generate_circular_array, simulate_covmats, simulate_snapshots, default_rng
+from music_utils import get_music_peaks_batch, source_powers
+from localization_utils import localize_direct
+from subspace_tracking import StreamingSubspaceTracker
+from KF.kalman_filter import KalmanFilter2D, KalmanFilterBank2D
+from KF.position_estimation import estimate_positions_batch
+from EKF.ekf_utils import ekf_update_multi
+
+# L-shaped room used by all demo scenarios
+ROOM_POLYGON = np.array([
+    [-15, -15],
+    [ 15, -15],
+    [ 15,   0],
+    [ 10,   0],
+    [ 10,  15],
+    [-15,  15],
+    [-15, -15]
+])
+
+# Array centers; a scenario with M arrays uses the first M of them
+ARRAY_CENTERS = np.array([
+    [  0.0,   0.0],
+    [-10.0,  -6.0],
+    [  8.0,  10.0],
+    [-12.0,  12.0],
+    [  5.0, -12.0],
+    [-12.0,  -2.0],
+    [  0.0,  12.0],
+    [ 12.0,  -5.0],
+])
+
+def make_arrays(centers, N=16, array_radius=1.0):
+    """
+    Stack of circular arrays (M x N x 2) around the given centers.
+    """
+    return np.stack([generate_circular_array(c, N, array_radius) for c in centers])
+
+SUBSPACE_METHODS = ("eigh", "pastd")
+
+def subspace_tracker(subspace, N, L, num_snapshot, shape=()):
+    """
+    Signal-subspace source of the tracking loops: None for "eigh" (a full
+    eigendecomposition of each frame's covariance), or a PASTd
+    StreamingSubspaceTracker for "pastd" that forgets with a time constant
+    of one frame (beta = 1 - 1 / num_snapshot).
+    """
+    if subspace not in SUBSPACE_METHODS:
+        raise ValueError(f"unknown subspace {subspace!r}, expected one of {SUBSPACE_METHODS}")
+    if subspace == "eigh":
+        return None
+    return StreamingSubspaceTracker(N, L, 1.0 - 1.0 / num_snapshot, shape)
+
+def measure_doas(arrays, centers, src_positions, alphas, snr, num_snapshot, Angles, L, rng,
+                 tracker=None):
+    """
+    Simulate one frame for all arrays and estimate L DoAs per array, from
+    the frame's covariances or, with a tracker (see subspace_tracker), from
+    its subspaces after ingesting the frame's snapshots.
+    Returns (doas (M, L), pidx (M, L), pspectra (M, G)).
+    """
+    src_positions = np.atleast_2d(src_positions)
+    thetas = np.arctan2(src_positions[None, :, 1] - centers[:, None, 1],
+                        src_positions[None, :, 0] - centers[:, None, 0])
+    if tracker is not None:
+        tracker.update_block(simulate_snapshots(arrays, thetas, alphas, snr, num_snapshot,
+                                                1, rng)[0])
+        return tracker.peaks(arrays, Angles)
+    CovMats = simulate_covmats(arrays, thetas, alphas, snr, num_snapshot, 1, rng)[0]
+    return get_music_peaks_batch(CovMats, L, arrays, Angles)
+
+def _random_amplitudes(L, rng):
+    return np.sqrt(0.5) * (rng.standard_normal(L) + 1j*rng.standard_normal(L))
+
+def run_intersection(src_positions, centers, snr=10.0, num_snapshot=100, N=16,
+                     array_radius=1.0, grid_size=360, room_polygon=ROOM_POLYGON, rng=None):
+    """
+    Single-frame localization of L sources: MUSIC DoAs and source powers per
+    array followed by multi-source triangulation (triangulate_sources).
+    Returns a dict of arrays (see the keys below) suitable for saving.
+    """
+    rng = default_rng(rng)
+    src_positions = np.atleast_2d(np.asarray(src_positions, dtype=float))
+    centers = np.asarray(centers, dtype=float)
+    L = len(src_positions)
+    arrays = make_arrays(centers, N, array_radius)
+    Angles = np.linspace(-np.pi, np.pi, grid_size)
+    alphas = _random_amplitudes(L, rng)
+
+    thetas = np.arctan2(src_positions[None, :, 1] - centers[:, None, 1],
+                        src_positions[None, :, 0] - centers[:, None, 0])
+    CovMats = simulate_covmats(arrays, thetas, alphas, snr, num_snapshot, 1, rng)[0]
+    doas, pidx, pspectra = get_music_peaks_batch(CovMats, L, arrays, Angles)
+    powers = source_powers(CovMats, doas, arrays)
+    estimates, _ = triangulate_sources(centers, list(doas), room_index(room_polygon),
+                                       powers=list(powers))
+    return {"room_polygon": np.asarray(room_polygon), "centers": centers, "arrays": arrays,
+            "src_positions": src_positions, "Angles": Angles, "doas": doas,
+            "pidx": pidx, "pspectra": pspectra, "powers": powers, "estimates": estimates}
+
+def run_direct(src_positions, centers, snr=10.0, num_snapshot=100, N=16,
+               array_radius=1.0, spacing=0.5, resolution=0.01, method="music",
+               room_polygon=ROOM_POLYGON, rng=None):
+    """
+    Single-frame localization of L sources directly in the position domain
+    (localize_direct): no per-array bearings, so no association step.
+    """
+    rng = default_rng(rng)
+    src_positions = np.atleast_2d(np.asarray(src_positions, dtype=float))
+    centers = np.asarray(centers, dtype=float)
+    L = len(src_positions)
+    arrays = make_arrays(centers, N, array_radius)
+    alphas = _random_amplitudes(L, rng)
+
+    thetas = np.arctan2(src_positions[None, :, 1] - centers[:, None, 1],
+                        src_positions[None, :, 0] - centers[:, None, 0])
+    CovMats = simulate_covmats(arrays, thetas, alphas, snr, num_snapshot, 1, rng)[0]
+    estimates, scores = localize_direct(CovMats, L, arrays, centers,
+                                        room_index(room_polygon), spacing, resolution, method)
+    return {"room_polygon": np.asarray(room_polygon), "centers": centers, "arrays": arrays,
+            "src_positions": src_positions, "estimates": estimates, "scores": scores}
+
+def _fixes_in_room(room, fixes):
+    """
+    Which (T, 2) fixes lie in the room; NaN fixes (fewer than two usable
+    bearings) count as outside.
+    """
+    inside = np.all(np.isfinite(fixes), axis=-1)
+    inside[inside] = room.contains(fixes[inside])
+    return inside
+
+def run_kf(src_position, centers, snr=5.0, num_snapshot=200, num_steps=20, N=16,
+           array_radius=1.0, grid_size=360, x0=None, q_scale=1e-4, r_scale=0.1,
+           room_polygon=ROOM_POLYGON, subspace="eigh", rng=None):
+    """
+    Track a single source: per frame, MUSIC DoAs of all arrays give a
+    least-squares (x, y) measurement that feeds KalmanFilter2D. The frames
+    do not depend on the filter, so all of them are measured first and
+    triangulated in one estimate_positions_batch call.
+    Measurements outside the room are dropped (predict only).
+    If x0 is None the filter starts from the first measurement in the room
+    (the track is NaN before it).
+    subspace="pastd" tracks the signal subspaces across frames instead of
+    decomposing every frame's covariance (see subspace_tracker).
+
+    With several sources (src_position of shape (L, 2)) the frames are
+    triangulated with triangulate_sources and tracked by a
+    KalmanFilterBank2D instead (see _run_kf_bank); the per-frame results
+    then carry an extra source axis.
+    """
+    rng = default_rng(rng)
+    src_position = np.asarray(src_position, dtype=float)
+    if src_position.ndim == 2:
+        return _run_kf_bank(src_position, centers, snr, num_snapshot, num_steps, N,
+                            array_radius, grid_size, x0, q_scale, r_scale, room_polygon,
+                            subspace, rng)
+    centers = np.asarray(centers, dtype=float)
+    arrays = make_arrays(centers, N, array_radius)
+    Angles = np.linspace(-np.pi, np.pi, grid_size)
+    alpha = _random_amplitudes(1, rng)
+    tracker = subspace_tracker(subspace, N, 1, num_snapshot, (len(centers),))
+
+    room = room_index(room_polygon)
+    kf = KalmanFilter2D(dt=1.0, q_scale=q_scale, r_scale=r_scale)
+    started = x0 is not None
+    if started:
+        kf.x_est = np.asarray(x0, dtype=float)
+    doa_history = np.array([measure_doas(arrays, centers, src_position, alpha, snr,
+                                         num_snapshot, Angles, 1, rng, tracker)[0][:, 0]
+                            for k in range(num_steps)]).reshape(num_steps, len(centers))
+    measurements, _, _ = estimate_positions_batch(centers, doa_history)
+    inside = _fixes_in_room(room, measurements)
+    track = []
+    for z, in_room in zip(measurements, inside):
+        if not started:
+            if not in_room:
+                track.append(np.full(2, np.nan))
+                continue
+            kf.x_est = z.copy()
+            started = True
+        kf.predict()
+        if in_room:
+            kf.update(z)
+        track.append(kf.x_est.copy())
+    return {"room_polygon": np.asarray(room_polygon), "centers": centers, "arrays": arrays,
+            "src_position": src_position, "doas": doa_history,
+            "measurements": measurements, "track": np.array(track).reshape(-1, 2)}
+
+def _run_kf_bank(src_positions, centers, snr, num_snapshot, num_steps, N, array_radius,
+                 grid_size, x0, q_scale, r_scale, room_polygon, subspace, rng):
+    """
+    Multi-source run_kf: one KalmanFilterBank2D track per source. Each
+    frame's L MUSIC DoAs per array are triangulated (triangulate_sources)
+    and the fixes are assigned to the predicted tracks by minimum total
+    distance (linear_sum_assignment); tracks without a fix only predict.
+    If x0 (L, 2) is None the bank starts from the first frame with L fixes.
+    """
+    centers = np.asarray(centers, dtype=float)
+    L = len(src_positions)
+    arrays = make_arrays(centers, N, array_radius)
+    Angles = np.linspace(-np.pi, np.pi, grid_size)
+    alphas = _random_amplitudes(L, rng)
+    tracker = subspace_tracker(subspace, N, L, num_snapshot, (len(centers),))
+
+    room = room_index(room_polygon)
+    bank = KalmanFilterBank2D(L, dt=1.0, q_scale=q_scale, r_scale=r_scale)
+    started = x0 is not None
+    if started:
+        bank.x_est[:] = np.asarray(x0, dtype=float)
+    doa_history, measurements, track = [], [], []
+    for k in range(num_steps):
+        doas, _, _ = measure_doas(arrays, centers, src_positions, alphas, snr,
+                                  num_snapshot, Angles, L, rng, tracker)
+        fixes, _ = triangulate_sources(centers, list(doas), room)
+        doa_history.append(doas)
+        z = np.full((L, 2), np.nan)
+        if not started:
+            if len(fixes) == L:
+                z = fixes.astype(float)
+                bank.x_est[:] = z
+                started = True
+            measurements.append(z)
+            track.append(bank.x_est.copy() if started else np.full((L, 2), np.nan))
+            continue
+        bank.predict()
+        if len(fixes):
+            dist = np.linalg.norm(bank.x_est[:, None] - fixes[None], axis=-1)
+            rows, cols = linear_sum_assignment(dist)
+            z[rows] = fixes[cols]
+            bank.update(z)
+        measurements.append(z)
+        track.append(bank.x_est.copy())
+    return {"room_polygon": np.asarray(room_polygon), "centers": centers, "arrays": arrays,
+            "src_position": src_positions, "doas": np.array(doa_history),
+            "measurements": np.array(measurements), "track": np.array(track)}
+
+def run_ekf(src_position, centers, snr=5.0, num_snapshot=200, num_steps=30, N=16,
+            array_radius=1.0, grid_size=360, x0=None, p0_scale=100.0, q_scale=1e-4,
+            r_scale=1e-2, room_polygon=ROOM_POLYGON, subspace="eigh", rng=None):
+    """
+    Track a single source with the bearings-only EKF (ekf_update_multi) fed
+    directly with the MUSIC DoAs of all arrays.
+    If x0 is None the filter starts from the first least-squares fix that
+    falls inside the room (frames before it only record the DoAs); as in
+    run_kf, the fixes of all frames come from one estimate_positions_batch
+    call. subspace is as in run_kf.
+    """
+    rng = default_rng(rng)
+    src_position = np.asarray(src_position, dtype=float)
+    centers = np.asarray(centers, dtype=float)
+    arrays = make_arrays(centers, N, array_radius)
+    Angles = np.linspace(-np.pi, np.pi, grid_size)
+    alpha = _random_amplitudes(1, rng)
+    tracker = subspace_tracker(subspace, N, 1, num_snapshot, (len(centers),))
+
+    P_est = np.eye(2) * p0_scale
+    # Assuming fixed source: F = I, Q is small
+    Q = np.eye(2) * q_scale
+    R = np.eye(len(centers)) * r_scale
+    room = room_index(room_polygon)
+    x_est = None if x0 is None else np.asarray(x0, dtype=float)
+    doa_history = np.array([measure_doas(arrays, centers, src_position, alpha, snr,
+                                         num_snapshot, Angles, 1, rng, tracker)[0][:, 0]
+                            for k in range(num_steps)]).reshape(num_steps, len(centers))
+    fixes, _, _ = estimate_positions_batch(centers, doa_history)
+    inside = _fixes_in_room(room, fixes)
+    track = []
+    for z_k, fix, in_room in zip(doa_history, fixes, inside):
+        if x_est is None and in_room:
+            x_est = fix
+        if x_est is None:
+            track.append(np.full(2, np.nan))
+            continue
+        P_est = P_est + Q
+        x_est, P_est = ekf_update_multi(x_est, P_est, z_k, centers, R)
+        track.append(x_est.copy())
+    return {"room_polygon": np.asarray(room_polygon), "centers": centers, "arrays": arrays,
+            "src_position": src_position, "doas": doa_history,
+            "track": np.array(track).reshape(-1, 2)}
+
+# -------------------------------------------------------------
+# Demo scenarios (the settings of main.py, KF/main.py, EKF/main.py)
+# -------------------------------------------------------------
+
+def demo_intersection(seed=6, L=3, snr=10.0, **kwargs):
+    rng = np.random.default_rng(seed)
+    src_positions = generate_random_points_in_polygon(ROOM_POLYGON, L, rng)
+    return run_intersection(src_positions, ARRAY_CENTERS[:2], snr=snr, rng=rng, **kwargs)
+
+def demo_kf(seed=42, snr=5.0, **kwargs):
+    rng = np.random.default_rng(seed)
+    src_position = generate_random_points_in_polygon(ROOM_POLYGON, 1, rng)[0]
+    kwargs.setdefault("x0", [5.0, -10.0])
+    return run_kf(src_position, ARRAY_CENTERS[:3], snr=snr, rng=rng, **kwargs)
+
+def demo_ekf(seed=42, snr=5.0, **kwargs):
+    rng = np.random.default_rng(seed)
+    src_position = generate_random_points_in_polygon(ROOM_POLYGON, 1, rng)[0]
+    kwargs.setdefault("x0", [-5.0, 10.0])
+    return run_ekf(src_position, ARRAY_CENTERS[:2], snr=snr, rng=rng, **kwargs)
+
+SCENARIOS = {"intersection": demo_intersection, "kf": demo_kf, "ekf": demo_ekf}
+
+def save_result(result, path):
+    """
+    Write a scenario result to .npz (arrays as-is) or .json (nested lists).
+    """
+    if str(path).endswith(".npz"):
+        np.savez(path, **result)
+        return
+    import json
+    def encode(v):
+        v = np.asarray(v)
+        if np.iscomplexobj(v):
+            return {"real": v.real.tolist(), "imag": v.imag.tolist()}
+        return v.tolist()
+    with open(path, "w") as f:
+        json.dump({k: encode(v) for k, v in result.items()}, f)
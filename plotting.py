@@ -0,0 +1,109 @@
+import numpy as np
+
+# matplotlib is imported inside each function so that importing this module
+# (or running the pipeline headless) does not pay for it.
+
+def plot_intersection(result, show=True):
+    """
+    MUSIC spectra of every array and the room layout with true and
+    estimated source positions (the figures of main.py).
+    """
+    import matplotlib.pyplot as plt
+
+    Angles = result["Angles"]
+    centers = result["centers"]
+    arrays = result["arrays"]
+    room_polygon = result["room_polygon"]
+    src_positions = result["src_positions"]
+    estimated_positions = result["estimates"]
+
+    # (a) MUSIC Spectra
+    M = len(centers)
+    plt.figure(figsize=(7*M, 5))
+    for m in range(M):
+        plt.subplot(1, M, m + 1)
+        pspectrum = result["pspectra"][m]
+        pidx = result["pidx"][m]
+        pidx = pidx[pidx >= 0]
+        psindB = np.log10(10 * pspectrum / pspectrum.min())
+        plt.plot(Angles, psindB, 'b-', linewidth=2, label="Spectrum")
+        for idx in pidx:
+            plt.plot(Angles[idx], psindB[idx], 'ro', markersize=8,
+                     label="Peak" if idx == pidx[0] else None)
+        cx, cy = centers[m]
+        plt.title(f'MUSIC Spectrum - Measurement {m+1} (Center ({cx:g},{cy:g}))')
+        plt.xlabel('Angle (rad)', fontsize=14)
+        plt.ylabel('Power (dB)', fontsize=14)
+        plt.legend(fontsize=14)
+    plt.tight_layout()
+    if show:
+        plt.show()
+
+    # Room Layout and Positions
+    plt.figure(figsize=(8,6))
+    _plot_room(plt, room_polygon)
+    plt.title('Microphone Arrays and Source Positioning')
+
+    colors = ['b', 'm', 'c', 'y', 'g']
+    for m, (center, arr) in enumerate(zip(centers, arrays)):
+        plt.plot(center[0], center[1], 'kx', markersize=12, linewidth=2, label=f'Center {m+1}')
+        plt.plot(arr[:,0], arr[:,1], colors[m % len(colors)] + 'o-', linewidth=2,
+                 label=f'Array {m+1}')
+
+    # True source positions
+    plt.plot(src_positions[:,0], src_positions[:,1], 'r*', markersize=14, label='True Sources')
+    for (xs, ys) in src_positions:
+        plt.text(xs, ys + 0.4, f"({xs:.2f}, {ys:.2f})", color='red')
+
+    # Estimated positions
+    if len(estimated_positions) > 0:
+        plt.plot(estimated_positions[:,0], estimated_positions[:,1], 'gx',
+                 markersize=12, linewidth=2, label=f'Estimates ({M} Measurements)')
+        for (xe, ye) in estimated_positions:
+            plt.text(xe, ye - 0.4, f"({xe:.2f}, {ye:.2f})", color='green')
+
+    # Draw arrows from array centers to sources
+    for px, py in centers:
+        for (xs, ys) in src_positions:
+            plt.arrow(px, py, xs - px, ys - py,
+                      length_includes_head=True,
+                      head_width=0.3,
+                      head_length=0.5,
+                      linestyle='--',
+                      linewidth=1.5,
+                      color='gray',
+                      alpha=0.6)
+
+    plt.legend()
+    if show:
+        plt.show()
+
+def plot_track(result, title, label, show=True):
+    """
+    Room, array centers, true source(s) and the filter's estimated path(s)
+    (the figures of KF/main.py and EKF/main.py).
+    """
+    import matplotlib.pyplot as plt
+
+    centers = result["centers"]
+    src_position = np.atleast_2d(result["src_position"])
+    track = np.asarray(result["track"])
+    track = track.reshape(len(track), -1, 2)
+
+    plt.figure(figsize=(8, 6))
+    _plot_room(plt, result["room_polygon"])
+    plt.plot(centers[:, 0], centers[:, 1], 'kx', markersize=10, label='Array Centers')
+    plt.plot(src_position[:, 0], src_position[:, 1], 'r*', markersize=12, label='True Source')
+    for i in range(track.shape[1]):
+        plt.plot(track[:, i, 0], track[:, i, 1], 'bo--', label=label if i == 0 else None)
+    plt.title(title)
+    plt.legend()
+    if show:
+        plt.show()
+
+def _plot_room(plt, room_polygon):
+    plt.plot(room_polygon[:, 0], room_polygon[:, 1], 'k-', linewidth=2)
+    plt.fill(room_polygon[:, 0], room_polygon[:, 1], facecolor='none',
+             edgecolor='k', linewidth=2)
+    plt.axis('equal')
+    plt.grid(True)
@@ -0,0 +1,164 @@
+"""
+Accuracy regression check of single precision against the float64 path.
+
+1. dtype audit: every array, MUSIC and triangulation stage run in "single"
+   precision must return float32/complex64 results (no hidden upcasts).
+   Intermediates are audited too: the DoAs of get_music_peaks_batch and
+   the prominences of top_peaks, which are computed on its internal
+   (log) spectrum.
+2. DoA budget: the same float64 covariances are processed in both
+   precisions; the single-precision DoAs must stay within --budget-deg of
+   the float64 ones and their RMSE against the truth within
+   --rmse-ratio * RMSE(double) + --floor-deg. The floor is the float32
+   resolution of the refined DoAs (|single - double| is about 0.002 deg
+   at any SNR, set by refine_music_peaks' tolerance), which dominates
+   once the float64 RMSE falls to the same order, e.g. at
+   --snr 1000 --snapshots 1000. --budget-deg assumes resolved peaks
+   (the default 5 dB / 200 snapshots or better); near or below the
+   detection threshold the flat float32 spectrum can move a peak further.
+3. Triangulated positions from both sets of DoAs must agree to --budget-m
+   (on trials where the float64 estimate is within 1 m of the source).
+
+Exits with status 1 when any check fails.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from array_utils import (use_precision, simulate_covmats, subspace_decomposition,
+                         music_spectrum, refine_music_peaks, steering_matrix_circular,
+                         top_peaks, clear_steering_cache, wrap_to_pi)
+from music_utils import get_music_peaks, get_music_peaks_batch, source_powers, wideband_music
+from geometry_utils import triangulate_sources, intersect_bearing_pairs
+from localization_utils import localize_direct
+from beamspace_utils import beamspace_doas
+from pipeline import ROOM_POLYGON, ARRAY_CENTERS, make_arrays
+
+def dtype_audit():
+    """
+    Run every stage in single precision and collect (stage, dtype) pairs
+    whose result is not float32/complex64.
+    """
+    rng = np.random.default_rng(0)
+    centers = ARRAY_CENTERS[:3]
+    arrays = make_arrays(centers)
+    Angles = np.linspace(-np.pi, np.pi, 360)
+    src = np.array([3.0, 4.0])
+    thetas = np.arctan2(src[1] - centers[:, 1], src[0] - centers[:, 0])[:, None]
+    bad = []
+
+    def check(stage, *values):
+        for v in values:
+            v = np.asarray(v)
+            if v.dtype.kind in "fc" and v.dtype not in (np.float32, np.complex64):
+                bad.append((stage, str(v.dtype)))
+
+    with use_precision("single"):
+        CovMats = simulate_covmats(arrays, thetas, [1.0], 5.0, 200, 1, rng)[0]
+        check("simulate_covmats", CovMats)
+        Qn = subspace_decomposition(CovMats[0], 1)
+        check("subspace_decomposition", Qn.eigvals, Qn.vectors)
+        check("steering_matrix_circular", steering_matrix_circular(arrays[0], Angles))
+        ps = music_spectrum(Qn, arrays[0], Angles)
+        check("music_spectrum", ps)
+        check("refine_music_peaks", refine_music_peaks(Qn, arrays[0], Angles[np.argmax(ps)],
+                                                       Angles[1] - Angles[0]))
+        doas, _, ps = get_music_peaks(CovMats[0], 1, 16, arrays[0], Angles, refine=True)
+        check("get_music_peaks", doas, ps)
+        doas, _, pss = get_music_peaks_batch(CovMats, 1, arrays, Angles)
+        check("get_music_peaks_batch", doas, pss)
+        peaks = top_peaks(pss, Angles, 1, log=True)
+        check("top_peaks", peaks.heights, peaks.prominences)
+        check("source_powers", source_powers(CovMats, doas, arrays))
+        check("beamspace_doas", beamspace_doas(CovMats, 1, arrays[0]))
+        check("wideband_music", wideband_music(CovMats[:2], 1, arrays[0], Angles,
+                                               [300.0, 400.0], workers=1)[0])
+        points, t, s = intersect_bearing_pairs(centers[0], thetas[0], centers[1], thetas[1])
+        check("intersect_bearing_pairs", points, t, s)
+        check("triangulate_sources", triangulate_sources(centers, list(thetas), ROOM_POLYGON)[0])
+        check("localize_direct", *localize_direct(CovMats, 1, arrays, centers, ROOM_POLYGON))
+    return bad
+
+def doa_budget(num_trials, snr, num_snapshot, seed):
+    """
+    float64 covariances -> refined DoAs and triangulated positions in both
+    precisions. Returns the DoA differences [deg], the per-precision errors
+    against the truth [deg] and the position differences [m].
+    """
+    rng = np.random.default_rng(seed)
+    centers = ARRAY_CENTERS[:3]
+    arrays = make_arrays(centers)
+    Angles = np.linspace(-np.pi, np.pi, 360)
+    diffs, errors, pos_diffs = [], {"double": [], "single": []}, []
+    for _ in range(num_trials):
+        src = rng.uniform(-8, 8, 2)
+        thetas = np.arctan2(src[1] - centers[:, 1], src[0] - centers[:, 0])
+        CovMats = simulate_covmats(arrays, thetas[:, None], [1.0], snr, num_snapshot, 1, rng)[0]
+        est = {}
+        for precision in ("double", "single"):
+            with use_precision(precision):
+                doas = np.array([get_music_peaks(C, 1, 16, a, Angles, refine=True)[0][0]
+                                 for C, a in zip(CovMats, arrays)])
+                est[precision] = (doas, triangulate_sources(centers, list(doas[:, None]))[0])
+            errors[precision].append(np.rad2deg(np.abs(wrap_to_pi(doas - thetas))))
+        diffs.append(np.rad2deg(np.abs(wrap_to_pi(est["single"][0] - est["double"][0]))))
+        p64, p32 = est["double"][1], est["single"][1]
+        if len(p64) and len(p32) and np.linalg.norm(p64[0] - src) < 1.0:
+            pos_diffs.append(np.linalg.norm(p32[0].astype(float) - p64[0]))
+    return (np.concatenate(diffs), {k: np.concatenate(v) for k, v in errors.items()},
+            np.array(pos_diffs))
+
+def main():
+    parser = argparse.ArgumentParser(description="Single vs double precision regression check")
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--snr", type=float, default=5.0)
+    parser.add_argument("--snapshots", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget-deg", type=float, default=0.01,
+                        help="max |single - double| DoA difference [deg]")
+    parser.add_argument("--rmse-ratio", type=float, default=1.01,
+                        help="max RMSE(single) / RMSE(double) against the truth, "
+                             "on top of --floor-deg")
+    parser.add_argument("--floor-deg", type=float, default=0.005,
+                        help="float32 resolution floor added to the RMSE budget [deg]")
+    parser.add_argument("--budget-m", type=float, default=0.01,
+                        help="max triangulated position difference [m]")
+    args = parser.parse_args()
+
+    ok = True
+    bad = dtype_audit()
+    for stage, dtype in bad:
+        print(f"FAIL dtype: {stage} returned {dtype} in single precision")
+    ok &= not bad
+    print(f"dtype audit: {'ok' if not bad else 'FAILED'}")
+
+    diffs, errors, pos_diffs = doa_budget(args.trials, args.snr, args.snapshots, args.seed)
+    rmse = {k: float(np.sqrt(np.mean(v**2))) for k, v in errors.items()}
+    ratio = rmse["single"] / rmse["double"]
+    rmse_budget = args.rmse_ratio * rmse["double"] + args.floor_deg
+    print(f"DoA |single - double| [deg]: median {np.median(diffs):.2e}  "
+          f"p99 {np.percentile(diffs, 99):.2e}  max {diffs.max():.2e}  (budget {args.budget_deg})")
+    print(f"DoA RMSE vs truth [deg]: double {rmse['double']:.4f}  single {rmse['single']:.4f}  "
+          f"ratio {ratio:.4f}  (budget {rmse_budget:.4f} = {args.rmse_ratio} x double "
+          f"+ {args.floor_deg})")
+    print(f"position |single - double| [m]: p99 {np.percentile(pos_diffs, 99):.2e}  "
+          f"max {pos_diffs.max():.2e}  (budget {args.budget_m})")
+    ok &= diffs.max() <= args.budget_deg
+    ok &= rmse["single"] <= rmse_budget
+    ok &= pos_diffs.max() <= args.budget_m
+
+    Angles = np.linspace(-np.pi, np.pi, 360)
+    arrays = make_arrays(ARRAY_CENTERS[:3])
+    for precision in ("double", "single"):
+        clear_steering_cache()
+        with use_precision(precision):
+            nbytes = steering_matrix_circular(arrays, Angles).nbytes
+        print(f"steering tensor (3 arrays x 16 x 360), {precision}: {nbytes / 1024:.0f} KiB")
+    clear_steering_cache()
+
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
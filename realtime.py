@@ -0,0 +1,440 @@
+"""
+Asyncio runtime for real-time localization.
+
+Every array runs as its own producer coroutine: it captures a frame,
+estimates the DoA in a worker thread (so a slow array never blocks the
+others) and pushes a Measurement into its own bounded queue. A single
+fusion consumer drains all queues and updates the filter as soon as
+measurements arrive:
+
+  ekf  one masked ekf_update_multi per bearing, right away
+  kf   one least-squares fix + KalmanFilter2D update per frame, once all
+       arrays reported, a later frame shows up or the frame is older than
+       max_age (>= 2 bearings needed)
+
+When a queue is full the producer follows the frame-drop policy:
+  block         wait for room (backpressure: a slow consumer slows producers)
+  drop_oldest   discard the oldest queued measurement (keep latency low)
+  drop_newest   discard the new measurement
+
+SimulatedArray stands in for the hardware, using measure_covmat (or a
+PASTd subspace tracker fed with the snapshots, subspace="pastd").
+"""
+import argparse
+import asyncio
+from collections import namedtuple
+
+import numpy as np
+
+from array_utils import simulate_snapshots
+from music_utils import measure_covmat, get_music_peaks
+from KF.kalman_filter import KalmanFilter2D
+from KF.position_estimation import estimate_positions_batch
+from EKF.ekf_utils import ekf_update_multi
+from geometry_utils import room_index
+from pipeline import ROOM_POLYGON, ARRAY_CENTERS, SUBSPACE_METHODS, make_arrays, subspace_tracker
+
+DROP_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+# t_capture: when the frame was captured, t_emit: when it was queued
+# (event-loop clock, seconds)
+Measurement = namedtuple("Measurement", ["array", "frame", "doa", "t_capture", "t_emit"])
+
+class SimulatedArray:
+    """
+    Simulated array front end: one covariance per frame from measure_covmat
+    and its MUSIC DoA, or with a tracker (pipeline.subspace_tracker) the
+    frame's snapshots folded into the tracked subspace and its DoA.
+
+    Parameters:
+      index: array number
+      array_2D: (N x 2) element positions
+      center: array center
+      trajectory: callable frame -> source position
+      alpha: complex source amplitude
+      delay, jitter: extra processing time per frame [s] (delay + U(0, jitter))
+      tracker: optional StreamingSubspaceTracker of this array
+    """
+    def __init__(self, index, array_2D, center, trajectory, alpha, snr, num_snapshot,
+                 Angles, rng, delay=0.0, jitter=0.0, tracker=None):
+        self.index = index
+        self.array_2D = array_2D
+        self.center = np.asarray(center, dtype=float)
+        self.trajectory = trajectory
+        self.alpha = alpha
+        self.snr = snr
+        self.num_snapshot = num_snapshot
+        self.Angles = Angles
+        self.rng = rng
+        self.delay = delay
+        self.jitter = jitter
+        self.tracker = tracker
+
+    def measure(self, frame):
+        """
+        Blocking DoA measurement of one frame (run in a worker thread).
+        Returns NaN when MUSIC finds no peak.
+        """
+        src = self.trajectory(frame)
+        theta = np.arctan2(src[1] - self.center[1], src[0] - self.center[0])
+        if self.tracker is not None:
+            self.tracker.update_block(simulate_snapshots(self.array_2D, [theta], [self.alpha],
+                                                         self.snr, self.num_snapshot, 1,
+                                                         self.rng)[0])
+            doas = self.tracker.doa(self.array_2D, self.Angles, refine=True)
+            return float(doas[0]) if len(doas) else np.nan
+        CovMat = measure_covmat(self.array_2D, theta, self.alpha, self.snr,
+                                self.num_snapshot, self.rng)
+        doas, _, _ = get_music_peaks(CovMat, 1, len(self.array_2D), self.array_2D,
+                                     self.Angles, refine=True)
+        return float(doas[0]) if len(doas) else np.nan
+
+    def processing_delay(self):
+        return self.delay + self.jitter * self.rng.random()
+
+class RuntimeStats:
+    """
+    Per-array counters and end-to-end latencies (capture -> filter update).
+    """
+    def __init__(self, num_arrays):
+        self.produced = np.zeros(num_arrays, dtype=int)
+        self.dropped = np.zeros(num_arrays, dtype=int)
+        self.late = np.zeros(num_arrays, dtype=int)
+        self.consumed = np.zeros(num_arrays, dtype=int)
+        self.blocked_s = np.zeros(num_arrays)
+        self.latencies = []
+        self.queue_waits = []
+
+    def summary(self):
+        """
+        Counters per array and latency statistics in milliseconds.
+        """
+        out = {"produced": self.produced.tolist(), "dropped": self.dropped.tolist(),
+               "late": self.late.tolist(), "consumed": self.consumed.tolist(),
+               "blocked_ms": (1e3 * self.blocked_s).tolist()}
+        for name, values in (("latency", self.latencies), ("queue_wait", self.queue_waits)):
+            ms = 1e3 * np.asarray(values)
+            if len(ms) == 0:
+                continue
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            out[name] = {"count": int(len(ms)), "mean_ms": float(ms.mean()),
+                         "p50_ms": float(p50), "p90_ms": float(p90),
+                         "p99_ms": float(p99), "max_ms": float(ms.max())}
+        return out
+
+async def _emit(queue, m, policy, stats):
+    loop = asyncio.get_running_loop()
+    if policy == "block":
+        start = loop.time()
+        await queue.put(m)
+        stats.blocked_s[m.array] += loop.time() - start
+        return
+    if queue.full():
+        stats.dropped[m.array] += 1
+        if policy == "drop_newest":
+            return
+        queue.get_nowait()
+    queue.put_nowait(m)
+
+async def array_producer(source, queue, num_frames, frame_period, policy, stats, t0):
+    """
+    Produce one Measurement per frame period into queue, then None.
+    A frame whose processing overruns its period starts the next frame late
+    (counted in stats.late) instead of piling up.
+    """
+    loop = asyncio.get_running_loop()
+    for frame in range(num_frames):
+        wait = t0 + frame * frame_period - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        elif frame > 0:
+            stats.late[source.index] += 1
+        t_capture = loop.time()
+        doa = await asyncio.to_thread(source.measure, frame)
+        delay = source.processing_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        stats.produced[source.index] += 1
+        await _emit(queue, Measurement(source.index, frame, doa, t_capture, loop.time()),
+                    policy, stats)
+    await queue.put(None)
+
+class FusionFilter:
+    """
+    KF or EKF fed with individual bearing measurements.
+
+    Both filters start from the first least-squares fix of a frame with at
+    least two bearings that falls inside the room; x0 overrides it.
+    on_measurement() and flush() return the measurements folded into the
+    state by this call (empty if the state did not change).
+
+    Frames wait in self.pending until they can be used. flush(now) bounds
+    that wait: a frame captured more than max_age seconds ago (default two
+    frame periods) is fused with the bearings it has in kf mode, or dropped
+    while the filter has not started yet. Measurements of frames that are
+    already fused arrive too late and are ignored in kf mode.
+    """
+    def __init__(self, centers, mode="ekf", frame_period=1.0, q_scale=1e-4, r_scale=1e-2,
+                 p0_scale=100.0, x0=None, room_polygon=ROOM_POLYGON, max_age=None):
+        if mode not in ("kf", "ekf"):
+            raise ValueError(f"unknown mode {mode!r}, expected 'kf' or 'ekf'")
+        self.centers = np.asarray(centers, dtype=float)
+        self.mode = mode
+        self.frame_period = frame_period
+        self.max_age = 2.0 * frame_period if max_age is None else max_age
+        self.room = room_index(room_polygon)
+        M = len(self.centers)
+        if mode == "kf":
+            self.kf = KalmanFilter2D(dt=1.0, q_scale=q_scale, r_scale=r_scale)
+        self.Q = np.eye(2) * q_scale
+        self.R = np.eye(M) * r_scale
+        self.P = np.eye(2) * p0_scale
+        self.x = None if x0 is None else np.asarray(x0, dtype=float)
+        if self.x is not None and mode == "kf":
+            self.kf.x_est = self.x.copy()
+        self.t_last = None
+        self.last_frame = -1
+        self.pending = {}                   # frame -> {array: Measurement}
+
+    @property
+    def estimate(self):
+        if self.x is None:
+            return np.full(2, np.nan)
+        return (self.kf.x_est if self.mode == "kf" else self.x).copy()
+
+    def _fix(self, ms):
+        doas = np.array([m.doa for m in ms])
+        centers = self.centers[[m.array for m in ms]]
+        z, _, _ = estimate_positions_batch(centers, doas)
+        return z if np.all(np.isfinite(z)) and self.room.contains(z) else None
+
+    def on_measurement(self, m):
+        if np.isnan(m.doa):
+            return []
+        if self.x is not None and self.mode == "ekf":
+            return self._ekf_update(m)
+        if m.frame <= self.last_frame:
+            return []
+        frame = self.pending.setdefault(m.frame, {})
+        frame[m.array] = m
+
+        if self.x is None:
+            if len(frame) < 2 or (z := self._fix(list(frame.values()))) is None:
+                return []
+            self.x = z
+            if self.mode == "kf":
+                self.kf.x_est = z.copy()
+            self.t_last = m.t_capture
+            used = list(frame.values())
+            self.last_frame = m.frame
+            # Older frames are stale now; in ekf mode the bearings of newer
+            # ones are folded in right away like any later measurement
+            self.pending = {f: ms for f, ms in self.pending.items() if f > m.frame}
+            if self.mode == "ekf":
+                later = [u for ms in self.pending.values() for u in ms.values()]
+                self.pending = {}
+                for u in sorted(later, key=lambda u: u.t_capture):
+                    used += self._ekf_update(u)
+            return used
+        return self._kf_frames(m.frame)
+
+    def flush(self, now):
+        """
+        Fuse (kf mode) or drop (filter not started) the pending frames
+        captured more than max_age before now.
+        """
+        stale = [f for f, ms in self.pending.items()
+                 if now - min(u.t_capture for u in ms.values()) > self.max_age]
+        if not stale:
+            return []
+        if self.x is None:
+            for f in stale:
+                del self.pending[f]
+            return []
+        return self._kf_frames(max(stale) + 1)
+
+    def _ekf_update(self, m):
+        # Random-walk prediction over the capture-time gap (Q is per frame)
+        if self.t_last is None:
+            self.t_last = m.t_capture
+        elif m.t_capture > self.t_last:
+            self.P = self.P + self.Q * (m.t_capture - self.t_last) / self.frame_period
+            self.t_last = m.t_capture
+        z = np.full(len(self.centers), np.nan)
+        z[m.array] = m.doa
+        self.x, self.P = ekf_update_multi(self.x, self.P, z, self.centers, self.R)
+        return [m]
+
+    def _kf_frames(self, newest):
+        """
+        Fuse every pending frame that is complete, or older than newest.
+        """
+        used = []
+        for frame in sorted(self.pending):
+            ms = self.pending[frame]
+            if len(ms) < len(self.centers) and frame >= newest:
+                break
+            del self.pending[frame]
+            if frame <= self.last_frame or len(ms) < 2:
+                continue
+            z = self._fix(list(ms.values()))
+            if z is None:
+                continue
+            for _ in range(frame - self.last_frame):
+                self.kf.predict()
+            self.kf.update(z)
+            self.last_frame = frame
+            used += list(ms.values())
+        return used
+
+async def fusion_consumer(queues, fusion, stats, consumer_delay=0.0):
+    """
+    Drain all array queues as measurements arrive, update the filter and
+    record end-to-end latencies. Pending frames are flushed at least every
+    fusion.max_age, and all of them once the producers are done. Returns
+    the track as a list of (time, frame, x, y) rows, one per state update.
+    """
+    loop = asyncio.get_running_loop()
+    gets = {asyncio.ensure_future(q.get()): q for q in queues}
+    track = []
+
+    def record(used):
+        if used:
+            now = loop.time()
+            stats.latencies += [now - u.t_capture for u in used]
+            track.append((now, max(u.frame for u in used), *fusion.estimate))
+
+    while gets:
+        done, _ = await asyncio.wait(gets, timeout=fusion.max_age,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            q = gets.pop(task)
+            m = task.result()
+            if m is None:
+                continue                            # that producer is finished
+            gets[asyncio.ensure_future(q.get())] = q
+            stats.consumed[m.array] += 1
+            stats.queue_waits.append(loop.time() - m.t_emit)
+            used = fusion.on_measurement(m)
+            if consumer_delay > 0:
+                await asyncio.sleep(consumer_delay)
+            record(used)
+        record(fusion.flush(loop.time()))
+    record(fusion.flush(np.inf))
+    return track
+
+async def run_realtime_async(src_position, centers, mode="ekf", num_frames=30,
+                             frame_period=0.05, queue_size=4, policy="drop_oldest",
+                             snr=5.0, num_snapshot=200, N=16, array_radius=1.0,
+                             grid_size=360, delays=None, jitter=0.0, consumer_delay=0.0,
+                             q_scale=1e-4, r_scale=1e-2, x0=None, max_age=None,
+                             subspace="eigh", room_polygon=ROOM_POLYGON, seed=None):
+    """
+    Coroutine behind run_realtime (use it directly inside a running loop).
+    """
+    if policy not in DROP_POLICIES:
+        raise ValueError(f"unknown policy {policy!r}, expected one of {DROP_POLICIES}")
+    centers = np.asarray(centers, dtype=float)
+    M = len(centers)
+    if callable(src_position):
+        trajectory = src_position
+    else:
+        src = np.asarray(src_position, dtype=float)
+        trajectory = lambda frame: src
+    arrays = make_arrays(centers, N, array_radius)
+    Angles = np.linspace(-np.pi, np.pi, grid_size)
+    delays = np.zeros(M) if delays is None else np.broadcast_to(delays, (M,))
+
+    # One independent stream per array, so the measurements do not depend
+    # on how the producers interleave
+    seeds = np.random.SeedSequence(seed).spawn(M + 1)
+    amp_rng = np.random.default_rng(seeds[-1])
+    alpha = np.sqrt(0.5) * (amp_rng.standard_normal() + 1j*amp_rng.standard_normal())
+    sources = [SimulatedArray(m, arrays[m], centers[m], trajectory, alpha, snr,
+                              num_snapshot, Angles, np.random.default_rng(seeds[m]),
+                              delays[m], jitter, subspace_tracker(subspace, N, 1, num_snapshot))
+               for m in range(M)]
+
+    stats = RuntimeStats(M)
+    fusion = FusionFilter(centers, mode, frame_period, q_scale, r_scale, x0=x0,
+                          room_polygon=room_polygon, max_age=max_age)
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(M)]
+    t0 = asyncio.get_running_loop().time()
+    producers = [asyncio.create_task(array_producer(s, q, num_frames, frame_period,
+                                                    policy, stats, t0))
+                 for s, q in zip(sources, queues)]
+    track = await fusion_consumer(queues, fusion, stats, consumer_delay)
+    await asyncio.gather(*producers)
+
+    track = np.array(track).reshape(-1, 4)
+    return {"room_polygon": np.asarray(room_polygon), "centers": centers, "arrays": arrays,
+            "src_position": np.asarray(trajectory(num_frames - 1), dtype=float),
+            "track_time": track[:, 0] - t0, "track_frame": track[:, 1].astype(int),
+            "track": track[:, 2:], "estimate": fusion.estimate, "stats": stats.summary()}
+
+def run_realtime(src_position, centers, **kwargs):
+    """
+    Run the asyncio real-time pipeline to completion.
+
+    Parameters (besides those of the offline pipeline):
+      src_position: fixed position, or callable frame -> position
+      mode: "ekf" or "kf"
+      num_frames, frame_period: frames per array and their period [s]
+      queue_size: capacity of each array's queue
+      policy: frame-drop policy when a queue is full (DROP_POLICIES)
+      delays, jitter: extra per-array processing time [s] (scalar or (M,))
+      consumer_delay: extra time per consumed measurement [s]
+      max_age: longest wait of a frame for its slowest array [s]
+               (default two frame periods, see FusionFilter)
+      subspace: "eigh" or "pastd" (see pipeline.subspace_tracker)
+      seed: seed of the per-array random streams
+
+    Returns a dict with the track (one row per state update), its times and
+    frames, the final estimate and stats (RuntimeStats.summary()).
+    """
+    return asyncio.run(run_realtime_async(src_position, centers, **kwargs))
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio real-time localization demo")
+    parser.add_argument("--mode", choices=("ekf", "kf"), default="ekf")
+    parser.add_argument("--arrays", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--period", type=float, default=0.05, help="frame period [s]")
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--policy", choices=DROP_POLICIES, default="drop_oldest")
+    parser.add_argument("--slow-array-delay", type=float, default=0.0,
+                        help="extra processing time of the last array [s]")
+    parser.add_argument("--consumer-delay", type=float, default=0.0)
+    parser.add_argument("--max-age", type=float, default=None,
+                        help="longest wait of a frame for its slowest array [s] "
+                             "(default: two frame periods)")
+    parser.add_argument("--subspace", choices=SUBSPACE_METHODS, default="eigh",
+                        help="per-frame eigendecomposition or PASTd subspace tracking")
+    parser.add_argument("--snr", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from geometry_utils import generate_random_points_in_polygon
+    src = generate_random_points_in_polygon(ROOM_POLYGON, 1, np.random.default_rng(args.seed))[0]
+    delays = np.zeros(args.arrays)
+    delays[-1] = args.slow_array_delay
+    result = run_realtime(src, ARRAY_CENTERS[:args.arrays], mode=args.mode,
+                          num_frames=args.frames, frame_period=args.period,
+                          queue_size=args.queue_size, policy=args.policy, snr=args.snr,
+                          delays=delays, consumer_delay=args.consumer_delay,
+                          max_age=args.max_age, subspace=args.subspace, seed=args.seed)
+
+    err = np.linalg.norm(result["estimate"] - src)
+    print(f"True source: {np.round(src, 2)}  final estimate: "
+          f"{np.round(result['estimate'], 2)}  error: {err:.3f} m")
+    stats = result["stats"]
+    for key in ("produced", "dropped", "late", "consumed"):
+        print(f"{key:>9}: {stats[key]}")
+    for key in ("latency", "queue_wait"):
+        if key in stats:
+            s = stats[key]
+            print(f"{key:>10} [ms]: mean {s['mean_ms']:.2f}  p50 {s['p50_ms']:.2f}  "
+                  f"p99 {s['p99_ms']:.2f}  max {s['max_ms']:.2f}")
+
+if __name__ == "__main__":
+    main()
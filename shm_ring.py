@@ -0,0 +1,333 @@
+"""
+Shared-memory ring buffer for snapshot blocks exchanged between processes.
+
+One writer process publishes fixed-shape blocks (e.g. the N x T complex
+snapshot matrix H of one array and frame); any number of reader processes
+attach by name and get read-only numpy views straight into the shared
+segment, so nothing is pickled or copied on the way.
+
+Every block carries a sequence number (0, 1, 2, ... in write order). A slot
+is marked busy while the writer fills it, and readers check the slot's
+sequence number again after using a view: if the writer has lapped them in
+the meantime the block is reported as overrun instead of silently handing
+out torn data. The writer never waits for readers.
+
+Layout of the segment:
+  header      int64[8]: write_seq (blocks published so far), capacity
+  slot_seq    int64[capacity]: sequence number held by each slot, -1 while written
+  data        dtype[capacity, *block_shape]
+"""
+import argparse
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_HEADER = 8
+_ALIGN = 64
+_BUSY = -1
+
+class RingOverrun(Exception):
+    """
+    The requested block was overwritten before (or while) it was read.
+    lost is the number of blocks the reader fell behind by.
+    """
+    def __init__(self, seq, lost):
+        super().__init__(f"block {seq} overwritten, reader lost {lost} blocks")
+        self.seq = seq
+        self.lost = lost
+
+class SnapshotRing:
+    """
+    Fixed-capacity ring of blocks in a multiprocessing SharedMemory segment.
+
+    Create it in the writer with SnapshotRing(block_shape, capacity, dtype)
+    and open it elsewhere with SnapshotRing.attach(ring.spec); spec is a
+    small picklable tuple that can be passed to worker processes.
+    """
+    def __init__(self, block_shape, capacity=16, dtype=np.complex128, name=None,
+                 _create=True):
+        self.block_shape = tuple(int(s) for s in block_shape)
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        data_offset = -(-8 * (_HEADER + self.capacity) // _ALIGN) * _ALIGN
+        size = data_offset + self.capacity * int(np.prod(self.block_shape)) * self.dtype.itemsize
+
+        if _create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            # Only the creating process owns (and unlinks) the segment.
+            # Before Python 3.13 attaching also registers the name with the
+            # resource tracker, which multiprocessing children share with
+            # their parent, so the registration is a no-op there.
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = _create
+        buf = self._shm.buf
+        self._header = np.ndarray((_HEADER,), dtype=np.int64, buffer=buf)
+        self._slot_seq = np.ndarray((self.capacity,), dtype=np.int64, buffer=buf,
+                                    offset=8 * _HEADER)
+        self._data = np.ndarray((self.capacity,) + self.block_shape, dtype=self.dtype,
+                                buffer=buf, offset=data_offset)
+        if _create:
+            self._header[:] = 0
+            self._header[1] = self.capacity
+            self._slot_seq[:] = _BUSY
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Open an existing ring from its spec (see the spec property).
+        """
+        name, block_shape, capacity, dtype = spec
+        return cls(block_shape, capacity, dtype, name=name, _create=False)
+
+    @property
+    def spec(self):
+        return (self._shm.name, self.block_shape, self.capacity, self.dtype.str)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def write_seq(self):
+        """
+        Number of blocks published so far (= sequence number of the next one).
+        """
+        return int(self._header[0])
+
+    # --- writer side -------------------------------------------------
+
+    def claim(self):
+        """
+        Reserve the next slot and return (seq, view) for filling it in place;
+        call publish(seq) when done. The slot is marked busy until then.
+        """
+        seq = self.write_seq
+        slot = seq % self.capacity
+        self._slot_seq[slot] = _BUSY
+        return seq, self._data[slot]
+
+    def publish(self, seq):
+        self._slot_seq[seq % self.capacity] = seq
+        self._header[0] = seq + 1
+
+    def write(self, block):
+        """
+        Copy one block into the ring and publish it. Returns its sequence number.
+        """
+        seq, view = self.claim()
+        view[...] = block
+        self.publish(seq)
+        return seq
+
+    # --- reader side -------------------------------------------------
+
+    def read(self, seq):
+        """
+        Read-only view of block seq, or None if it is not published yet.
+        Raises RingOverrun if it has already been overwritten. The view
+        aliases shared memory: check valid(seq) after using it.
+        """
+        head = self.write_seq
+        if seq >= head:
+            return None
+        if head - seq > self.capacity or self._slot_seq[seq % self.capacity] != seq:
+            raise RingOverrun(seq, head - self.capacity - seq)
+        view = self._data[seq % self.capacity].view()
+        view.setflags(write=False)
+        return view
+
+    def valid(self, seq):
+        """
+        True if block seq is still intact (not being or already overwritten).
+        """
+        return (self._slot_seq[seq % self.capacity] == seq and
+                self.write_seq - seq <= self.capacity)
+
+    def wait(self, seq, timeout=None, poll=1e-4):
+        """
+        Wait until block seq is published; returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.write_seq <= seq:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def close(self):
+        """
+        Detach from the segment; the creating process also unlinks it.
+        """
+        self._header = self._slot_seq = self._data = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+class RingReader:
+    """
+    Sequential reader with its own cursor.
+
+    next() returns (seq, view) of the next block. When the writer has lapped
+    the reader, it skips ahead to the oldest intact block and counts the
+    lost blocks in self.lost (on_overrun="skip"), or raises RingOverrun
+    (on_overrun="raise").
+    """
+    def __init__(self, ring, start=0, on_overrun="skip"):
+        self.ring = ring
+        self.seq = start
+        self.on_overrun = on_overrun
+        self.lost = 0
+
+    def next(self, timeout=None):
+        """
+        Next block as (seq, read-only view), or None on timeout.
+        """
+        while True:
+            if not self.ring.wait(self.seq, timeout):
+                return None
+            try:
+                view = self.ring.read(self.seq)
+            except RingOverrun:
+                if self.on_overrun == "raise":
+                    raise
+                # oldest block that cannot be overwritten by the next write
+                skip_to = self.ring.write_seq - self.ring.capacity + 1
+                self.lost += max(skip_to - self.seq, 1)
+                self.seq = max(skip_to, self.seq + 1)
+                continue
+            seq = self.seq
+            self.seq += 1
+            return seq, view
+
+    def done(self, seq):
+        """
+        Confirm the view of block seq was not overwritten while in use;
+        counts it as lost (and returns False) otherwise.
+        """
+        if self.ring.valid(seq):
+            return True
+        self.lost += 1
+        return False
+
+# -------------------------------------------------------------
+# MUSIC workers reading snapshots from shared memory
+# -------------------------------------------------------------
+
+def music_worker(snapshot_spec, result_spec, L, array_2D, Angles, num_blocks,
+                 refine=True, timeout=10.0, ready=None):
+    """
+    Worker process body: read num_blocks snapshot blocks H (N x T) from the
+    snapshot ring, form the covariance and run music_utils.get_music_peaks
+    directly on the shared-memory view, and publish [seq, doa_1..doa_L]
+    into the result ring (NaN for missing peaks). Blocks overwritten while
+    in use are dropped. Returns the number of lost blocks.
+
+    ready is an optional barrier (e.g. multiprocessing.Manager().Barrier)
+    the worker waits on once both rings are attached, so the writer can
+    hold back its first block until every reader is in place.
+    """
+    from array_utils import snapshot_covariance
+    from music_utils import get_music_peaks
+
+    ring = SnapshotRing.attach(snapshot_spec)
+    results = SnapshotRing.attach(result_spec)
+    reader = RingReader(ring)
+    N = ring.block_shape[0]
+    if ready is not None:
+        ready.wait()
+    try:
+        while reader.seq < num_blocks:
+            item = reader.next(timeout)
+            if item is None:
+                break
+            seq, H = item
+            CovMat = snapshot_covariance(H)
+            if not reader.done(seq):
+                continue
+            doas, _, _ = get_music_peaks(CovMat, L, N, array_2D, Angles, refine=refine)
+            out = np.full(L + 1, np.nan)
+            out[0] = seq
+            out[1:1 + len(doas)] = doas
+            results.write(out)
+        return reader.lost
+    finally:
+        ring.close()
+        results.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Shared-memory MUSIC workers, one process per array")
+    parser.add_argument("--arrays", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--snapshots", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=32)
+    parser.add_argument("--snr", type=float, default=5.0)
+    parser.add_argument("--period", type=float, default=0.02,
+                        help="frame period of the writer in seconds (0: as fast as possible)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import Manager
+    from array_utils import simulate_snapshots
+    from pipeline import ARRAY_CENTERS, make_arrays
+
+    rng = np.random.default_rng(args.seed)
+    M, N, T, L = args.arrays, 16, args.snapshots, 1
+    centers = ARRAY_CENTERS[:M]
+    arrays = make_arrays(centers, N)
+    Angles = np.linspace(-np.pi, np.pi, 360)
+    src = np.array([3.0, 4.0])
+    thetas = np.arctan2(src[1] - centers[:, 1], src[0] - centers[:, 0])[:, None]
+
+    rings = [SnapshotRing((N, T), args.capacity) for _ in range(M)]
+    result_rings = [SnapshotRing((L + 1,), args.frames, np.float64) for _ in range(M)]
+    with Manager() as manager, ProcessPoolExecutor(max_workers=M) as pool:
+        # The writer never waits for readers, so start only once all are attached
+        ready = manager.Barrier(M + 1, timeout=60)
+        futures = [pool.submit(music_worker, r.spec, rr.spec, L, arrays[m], Angles,
+                               args.frames, ready=ready)
+                   for m, (r, rr) in enumerate(zip(rings, result_rings))]
+        ready.wait()
+        start = time.perf_counter()
+        for k in range(args.frames):
+            H = simulate_snapshots(arrays, thetas, [1.0], args.snr, T, 1, rng)[0]
+            for m in range(M):
+                seq, view = rings[m].claim()
+                view[...] = H[m]
+                rings[m].publish(seq)
+            # Pace to the frame period like a live capture would
+            time.sleep(max(0.0, start + (k + 1) * args.period - time.perf_counter()))
+        lost = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    for m in range(M):
+        reader = RingReader(result_rings[m], on_overrun="raise")
+        rows = []
+        while True:
+            item = reader.next(timeout=0)
+            if item is None:
+                break
+            rows.append(item[1].copy())
+        res = np.array(rows).reshape(-1, L + 1)
+        err = np.rad2deg(np.abs(np.angle(np.exp(1j * (res[:, 1] - thetas[m, 0])))))
+        print(f"array {m}: {len(res)} frames processed, {lost[m]} lost, "
+              f"median DoA error {np.nanmedian(err):.3f} deg")
+    print(f"{args.frames} frames x {M} arrays in {elapsed:.2f} s")
+    for r in rings + result_rings:
+        r.close()
+
+if __name__ == "__main__":
+    main()
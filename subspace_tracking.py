@@ -0,0 +1,108 @@
+import numpy as np
+
+from array_utils import (
+    Subspace,
+    complex_dtype,
+    music_spectrum,
+    top_peaks,
+    refine_music_peaks,
+    _grid_step,
+)
+
+class StreamingSubspaceTracker:
+    """
+    Streaming signal-subspace estimator for one array or a stack of arrays.
+
+    Snapshots are ingested one at a time (or block-wise) and the
+    L-dimensional signal subspace W of the exponentially weighted covariance
+        R_k = beta * R_{k-1} + x_k x_k^H
+    is tracked recursively with PASTd (Yang, "Projection approximation
+    subspace tracking", 1995), so the current MUSIC spectrum or DoA is
+    available without a fresh O(N^3) eigendecomposition per frame. R itself
+    is never formed: each snapshot costs O(N L) and the state is O(N L) no
+    matter how long the stream runs.
+
+    With shape=(M,) the tracker holds M independent subspaces (e.g. one
+    per array of a frame) updated together, snapshots then being (M, N).
+    """
+    def __init__(self, N, L, forgetting=0.97, shape=()):
+        if not 0 < L < N:
+            raise ValueError(f"number of sources L={L} must satisfy 0 < L < N={N}")
+        if not 0.0 < forgetting <= 1.0:
+            raise ValueError("forgetting factor must be in (0, 1]")
+        self.N = N
+        self.L = L
+        self.beta = forgetting
+        self.shape = tuple(shape)
+
+        # Tracked signal subspace and its eigenvalue estimates
+        self.W = np.zeros(self.shape + (N, L), dtype=complex_dtype())
+        self.W[..., :, :] = np.eye(N, L)
+        self.d = np.ones(self.shape + (L,), dtype=self.W.real.dtype)
+        self.num_snapshots = 0
+
+    def update(self, x):
+        """
+        Ingest a single snapshot x (shape + (N,)).
+        """
+        x = np.asarray(x, dtype=self.W.dtype)
+        beta = self.beta
+
+        # PASTd: deflate x through the L tracked eigenvectors one by one
+        for i in range(self.L):
+            w = self.W[..., i]
+            y = np.sum(w.conj() * x, axis=-1, keepdims=True)
+            self.d[..., i] = beta * self.d[..., i] + np.abs(y[..., 0])**2
+            w += (x - w * y) * (y.conj() / self.d[..., i, None])
+            x = x - w * y
+        self.num_snapshots += 1
+
+    def update_block(self, H):
+        """
+        Ingest a block of snapshots H (shape + (N, T)), column by column.
+        """
+        H = np.asarray(H, dtype=self.W.dtype)
+        for t in range(H.shape[-1]):
+            self.update(H[..., t])
+
+    def subspace(self):
+        """
+        Current signal subspace as a Subspace (see array_utils).
+        The tracked vectors are re-orthonormalized with a thin QR (O(N L^2)).
+        """
+        order = np.argsort(self.d, axis=-1)[..., ::-1]
+        Q, _ = np.linalg.qr(np.take_along_axis(self.W, order[..., None, :], axis=-1))
+        return Subspace(np.take_along_axis(self.d, order, axis=-1), Q, False)
+
+    def spectrum(self, array_2D, Angles):
+        """
+        MUSIC pseudospectrum of the tracked subspace over Angles
+        (array_2D is N x 2, or shape + (N, 2) for a stack).
+        """
+        return music_spectrum(self.subspace(), array_2D, Angles)
+
+    def doa(self, array_2D, Angles, refine=False):
+        """
+        Current DoA estimates (sorted, radians) of the L tracked sources.
+        With refine=True, Angles is a coarse grid refined as in get_music_peaks.
+        """
+        sub = self.subspace()
+        pspectrum = music_spectrum(sub, array_2D, Angles)
+        pidx = top_peaks(pspectrum, Angles, self.L, log=True).indices
+        pidx = pidx[pidx >= 0]
+        doas = Angles[pidx]
+        if refine:
+            doas = refine_music_peaks(sub, array_2D, doas, _grid_step(Angles))
+        return np.sort(doas)
+
+    def peaks(self, arrays, Angles):
+        """
+        Counterpart of get_music_peaks_batch for a stack of trackers:
+        (doas, pidx, pspectra) with doas (shape + (L,)) sorted by angle and
+        NaN / -1 where fewer peaks exist.
+        """
+        pspectra = self.spectrum(arrays, Angles)
+        pidx, doas, _, _ = top_peaks(pspectra, Angles, self.L, log=True)
+        order = np.argsort(doas, axis=-1)
+        return (np.take_along_axis(doas, order, axis=-1),
+                np.take_along_axis(pidx, order, axis=-1), pspectra)